@@ -3,24 +3,136 @@ Acquire traffic data
 
 Functions:
 - get_traffic_data
+- read_traffic_chunks
+- file_fingerprint
+- code_fingerprint
+- evict_lru
+- get_cached_traffic_data
+- get_prepared_data
+- save_dataset
+- open_dataset
+- get_engine
+- read_traffic_sql_chunks
+- get_traffic_data_sql
+- get_rollup
+- get_incremental_data
 '''
 
 ##### IMPORTS #####
-#import os
+import os
+import glob
+import json
+import hashlib
+import inspect
 import numpy as np
 import pandas as pd
 
-def get_traffic_data():
-    
-    df = pd.read_csv('originial-traff-csv.zip')
+# filename of the zipped US-Accidents csv
+TRAFFIC_FILE = 'originial-traff-csv.zip'
+
+# raw columns that prepare actually uses, with declared dtypes so the parser
+# never has to infer them (Start_Time/End_Time are parsed later in prepare)
+TRAFFIC_DTYPES = {
+    'ID': 'object', 'Severity': 'int64', 'Start_Time': 'object', 'End_Time': 'object',
+    'Distance(mi)': 'float64', 'Street': 'object', 'City': 'object', 'County': 'object',
+    'State': 'object', 'Zipcode': 'object', 'Country': 'object', 'Temperature(F)': 'float64',
+    'Wind_Chill(F)': 'float64', 'Humidity(%)': 'float64', 'Pressure(in)': 'float64',
+    'Visibility(mi)': 'float64', 'Wind_Direction': 'object', 'Wind_Speed(mph)': 'float64',
+    'Precipitation(in)': 'float64', 'Weather_Condition': 'object', 'Amenity': 'bool',
+    'Bump': 'bool', 'Crossing': 'bool', 'Give_Way': 'bool', 'Junction': 'bool',
+    'No_Exit': 'bool', 'Railway': 'bool', 'Roundabout': 'bool', 'Station': 'bool',
+    'Stop': 'bool', 'Traffic_Calming': 'bool', 'Traffic_Signal': 'bool',
+    'Turning_Loop': 'bool', 'Sunrise_Sunset': 'object'
+    }
+
+# states kept by prepare.prep_traffic
+TRAFFIC_STATES = ['CA', 'TX']
+
+# directory for the columnar raw / prepared caches, their size limit (LRU evicted)
+# and the chunk size the typed reader builds the raw cache with
+CACHE_DIR = 'cache'
+CACHE_BYTES = 10 * 2**30
+CACHE_CHUNKSIZE = 250_000
+
+# database and table holding the accidents in production
+TRAFFIC_DB = 'traffic'
+TRAFFIC_TABLE = 'accidents'
+
+# pooled engines by connection url, reused across calls
+_ENGINES = {}
+
+
+def _find_col(columns, name):
+    '''Return the column in columns matching name regardless of case'''
+    for col in columns:
+        if col.lower() == name.lower():
+            return col
+    raise KeyError(name)
+
+
+def _header_dtypes(filename, wanted):
+    '''
+    Map the declared (lowercase) dtypes onto the header of filename, since
+    read_csv needs the dtype keys spelled exactly as they are in the file
+    '''
+    header = pd.read_csv(filename, nrows=0).columns
+    return {col: wanted[col.lower()] for col in header if col.lower() in wanted}
+
+
+def read_traffic_chunks(filename=TRAFFIC_FILE, chunksize=250_000, states=TRAFFIC_STATES,
+                        start_time=None, dtypes=TRAFFIC_DTYPES, stats=None):
+    """
+    This function will:
+    - read the traffic csv (zipped or not) in chunks of chunksize rows
+    - load only the columns in dtypes, parsed with the declared dtypes
+    - keep only rows in states (None keeps every state)
+    - keep only rows with a start time on or after start_time (optional)
+    - yield each filtered chunk
+    - count rows read and rows kept in the stats dict, if one is passed
+    """
+    wanted = {col.lower(): dtype for col, dtype in dtypes.items()}
+    if start_time is not None:
+        # start times in the source are ISO strings, so they compare as text
+        start_time = str(pd.Timestamp(start_time))
+    reader = pd.read_csv(filename, chunksize=chunksize,
+                         usecols=lambda col: col.lower() in wanted,
+                         dtype=_header_dtypes(filename, wanted))
+    for chunk in reader:
+        if stats is not None:
+            stats['rows_read'] = stats.get('rows_read', 0) + len(chunk)
+        mask = np.ones(len(chunk), dtype=bool)
+        if states is not None:
+            mask &= chunk[_find_col(chunk.columns, 'state')].isin(states).to_numpy()
+        if start_time is not None:
+            mask &= (chunk[_find_col(chunk.columns, 'start_time')] >= start_time).to_numpy()
+        if not mask.all():
+            chunk = chunk[mask]
+        if stats is not None:
+            stats['rows_kept'] = stats.get('rows_kept', 0) + len(chunk)
+        yield chunk
+
+
+def get_traffic_data(filename=TRAFFIC_FILE, chunksize=None, states=TRAFFIC_STATES,
+                     start_time=None):
     """
     This function reads traffic data from a CSV file or from kaggle.com and caches it locally for future
     use.
+    :param chunksize: if given, stream the file in chunks of this many rows, loading only the
+    columns prepare uses and applying the states / start_time filters per chunk, so the whole
+    national file is never held in memory. Rows read and rows kept are printed.
     :return: The function `get_traffic_data()` returns a pandas DataFrame containing information about different
     traffic incidents. If the data is already cached locally in a CSV file named 'original-traff-csv.zip', it reads the
     data from the file and returns it. Otherwise, it fetches the data from two different URLs on
     kaggle, combines them into a single DataFrame, saves the data to a CSV file named 'originial-traff-csv.zip',
     """
+    if chunksize is None:
+        return pd.read_csv(filename)
+    stats = {}
+    chunks = read_traffic_chunks(filename, chunksize=chunksize, states=states,
+                                 start_time=start_time, stats=stats)
+    df = pd.concat(chunks)
+    print(f"rows read: {stats.get('rows_read', 0):,}   rows kept: {stats.get('rows_kept', 0):,}")
+    df.attrs.update(stats)
     # filename of csv
    # filename='original-traff-csv.zip'
     # if cached data exist
@@ -30,4 +142,498 @@ def get_traffic_data():
     #else:
         # kaggle links
     #    df = pd.read_csv('https://www.kaggle.com/datasets/sobhanmoosavi/us-accidents')
-    return df
\ No newline at end of file
+    return df
+
+
+
+##### COLUMNAR CACHE #####
+
+def file_fingerprint(filename, sample=1 << 20):
+    '''
+    Fingerprint a source file from its size, modification time and a hash of
+    its first and last sample bytes, so multi-GB files are not re-read in full
+    '''
+    stat = os.stat(filename)
+    h = hashlib.sha1(f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    with open(filename, 'rb') as f:
+        h.update(f.read(sample))
+        if stat.st_size > sample:
+            f.seek(max(stat.st_size - sample, sample))
+            h.update(f.read(sample))
+    return h.hexdigest()
+
+
+def _source(obj):
+    '''Source code of a function, class or module (repr for things inspect cannot read, e.g. partials)'''
+    try:
+        return inspect.getsource(obj)
+    except (TypeError, OSError):
+        return repr(obj)
+
+
+def code_fingerprint(func, deps=()):
+    '''
+    Hash of the whole module func is defined in (its helpers and constants are
+    part of what it computes) and of each extra dependency in deps
+    '''
+    module = inspect.getmodule(func)
+    parts = [_source(module if module is not None else func)] + [_source(dep) for dep in deps]
+    return hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+
+def evict_lru(files, max_bytes, keep=None):
+    '''Delete the least recently modified of files until the rest fit in max_bytes'''
+    files = sorted(files, key=os.path.getmtime)
+    total = sum(os.path.getsize(f) for f in files)
+    for f in files:
+        if total <= max_bytes:
+            break
+        if f != keep:
+            total -= os.path.getsize(f)
+            os.remove(f)
+
+
+def _cache_key(*parts):
+    '''Hash the repr of parts into a short cache key'''
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+def _write_frame(df, path, fmt):
+    '''Write df to path as parquet or feather (feather needs a default index)'''
+    if fmt == 'parquet':
+        df.to_parquet(path)
+    elif fmt == 'feather':
+        df.reset_index(names='__index__').to_feather(path)
+    else:
+        raise ValueError(f'unknown cache format: {fmt}')
+
+
+def _read_frame(path, fmt):
+    '''Read a frame written by _write_frame'''
+    if fmt == 'parquet':
+        return pd.read_parquet(path)
+    df = pd.read_feather(path).set_index('__index__')
+    df.index.name = None
+    return df
+
+
+def _cached(name, key, build, cache_dir, fmt):
+    """
+    This function will:
+    - return the frame cached as <name>-<key>.<fmt> in cache_dir if it exists
+    - otherwise call build() and write the result
+    - other keys stay cached until the cache dir is over CACHE_BYTES, then the
+      least recently used files are evicted
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f'{name}-{key}.{fmt}')
+    if os.path.isfile(path):
+        # touch it, the LRU eviction goes by modification time
+        os.utime(path)
+        return _read_frame(path, fmt)
+    df = build()
+    _write_frame(df, path, fmt)
+    files = [f for cached in ('raw', 'prepared') for f in glob.glob(os.path.join(cache_dir, f'{cached}-*.*'))]
+    evict_lru(files, CACHE_BYTES, keep=path)
+    return df
+
+
+def _read_kwargs(read_kwargs):
+    '''get_traffic_data arguments the raw cache is built with: the typed chunked reader by default'''
+    return {'chunksize': CACHE_CHUNKSIZE, **read_kwargs}
+
+
+def get_cached_traffic_data(filename=TRAFFIC_FILE, cache_dir=CACHE_DIR, fmt='parquet', **read_kwargs):
+    """
+    This function will:
+    - fingerprint the source file together with the get_traffic_data arguments
+    - return the raw frame from the columnar cache when the fingerprint matches
+    - otherwise read it with get_traffic_data(filename, **read_kwargs) and cache it;
+      chunksize defaults to CACHE_CHUNKSIZE, so the columns get their declared
+      TRAFFIC_DTYPES instead of types guessed per block (which can mix ints and
+      strings in one column and fail to write)
+    """
+    read_kwargs = _read_kwargs(read_kwargs)
+    key = _cache_key(file_fingerprint(filename), sorted(read_kwargs.items()))
+    return _cached('raw', key, lambda: get_traffic_data(filename, **read_kwargs), cache_dir, fmt)
+
+
+def get_prepared_data(filename=TRAFFIC_FILE, prep=None, prep_kwargs=None, cache_dir=CACHE_DIR,
+                      fmt='parquet', **read_kwargs):
+    """
+    This function will:
+    - fingerprint the source file, the reader arguments, the source of the module
+      the prepare function is defined in (code_fingerprint) and its parameters
+    - return the prepared frame from the columnar cache when the fingerprint matches,
+      with its datetimes and categoricals already typed
+    - otherwise prepare the (cached) raw frame with prep (default prepare.prep_traffic)
+      and cache the result
+    - replaces the old output.csv round-trip
+    """
+    if prep is None:
+        import prepare
+        prep = prepare.prep_traffic
+    prep_kwargs = prep_kwargs or {}
+    key = _cache_key(file_fingerprint(filename), sorted(_read_kwargs(read_kwargs).items()),
+                     code_fingerprint(prep), sorted(prep_kwargs.items()))
+
+    def build():
+        raw = get_cached_traffic_data(filename, cache_dir=cache_dir, fmt=fmt, **read_kwargs)
+        return prep(raw, **prep_kwargs)
+
+    return _cached('prepared', key, build, cache_dir, fmt)
+
+
+
+##### MEMORY-MAPPED DATASET #####
+
+def _dataset_values(s, label):
+    '''
+    Values of a column or index as save_dataset stores them: text as category
+    codes plus the categories, anything else as is (np.load cannot memory-map objects)
+    '''
+    if s.dtype == object or str(s.dtype) in ('category', 'string'):
+        cat = pd.Series(s).astype('category')
+        return cat.cat.codes.to_numpy(), [str(c) for c in cat.cat.categories]
+    values = np.asarray(s)
+    if values.dtype == object:
+        raise ValueError(f'cannot memory-map the {s.dtype} values of {label}')
+    return values, None
+
+
+def save_dataset(df, path):
+    """
+    This function will:
+    - take in a prepared dataframe and a directory path
+    - write every column to its own .npy file (text columns as category codes,
+      with the categories kept in meta.json)
+    - write the index the same way, so open_dataset can memory-map it all
+    - raise a ValueError for a column or index that is neither text nor a plain
+      numpy dtype (e.g. tz-aware timestamps)
+    """
+    os.makedirs(path, exist_ok=True)
+    meta = {'columns': [], 'categories': {}, 'index_name': df.index.name}
+    values, categories = _dataset_values(df.index, 'the index')
+    if categories is not None:
+        meta['index_categories'] = categories
+    np.save(os.path.join(path, '__index__.npy'), values)
+    for i, col in enumerate(df.columns):
+        values, categories = _dataset_values(df[col], repr(col))
+        if categories is not None:
+            meta['categories'][col] = categories
+        # columns are stored by position, names may not be valid file names
+        np.save(os.path.join(path, f'{i}.npy'), values)
+        meta['columns'].append(col)
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+class TrafficDataset:
+    '''
+    Read-only handle on a dataset written by save_dataset. Every column is a
+    memory-mapped .npy file, so processes opening the same dataset share the
+    pages instead of each holding a private copy of the frame.
+
+    - ds['temp'] returns the column as a (memory-mapped) numpy array
+    - ds[['temp', 'severity']] returns a DataFrame over those columns only
+    - ds.take(rows) returns a handle on a subset of rows without reading any column
+    '''
+
+    def __init__(self, path, rows=None, _arrays=None):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if _arrays is None:
+            _arrays = {'__index__': np.load(os.path.join(path, '__index__.npy'), mmap_mode='r')}
+            for i, col in enumerate(self.meta['columns']):
+                _arrays[col] = np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r')
+        self._arrays = _arrays
+        self.rows = rows
+
+    @property
+    def columns(self):
+        return pd.Index(self.meta['columns'])
+
+    @property
+    def index(self):
+        values = self._values('__index__')
+        if 'index_categories' in self.meta:
+            # text index, stored as codes
+            values = pd.Categorical.from_codes(values, self.meta['index_categories']).to_numpy()
+        return pd.Index(values, name=self.meta['index_name'])
+
+    @property
+    def shape(self):
+        return len(self), len(self.columns)
+
+    def __len__(self):
+        if self.rows is None:
+            return len(self._arrays['__index__'])
+        return len(self.rows)
+
+    def _values(self, col):
+        '''The raw (code) array for col, gathered only if this handle is a row subset'''
+        values = self._arrays[col]
+        if self.rows is not None:
+            values = values[self.rows]
+        return values
+
+    def _column(self, col):
+        '''col as a numpy array or, for text columns, a Categorical'''
+        values = self._values(col)
+        if col in self.meta['categories']:
+            return pd.Categorical.from_codes(values, self.meta['categories'][col])
+        return values
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._column(key)
+        # one block per column, so numeric columns stay on the mapped pages
+        return pd.DataFrame({col: self._column(col) for col in key}, index=self.index, copy=False)
+
+    def take(self, rows):
+        '''Handle on the given row positions, sharing the mapped columns'''
+        rows = np.asarray(rows)
+        if self.rows is not None:
+            rows = self.rows[rows]
+        return TrafficDataset(self.path, rows=rows, _arrays=self._arrays)
+
+    def to_frame(self, columns=None):
+        '''DataFrame over columns (default all)'''
+        return self[list(self.columns if columns is None else columns)]
+
+
+def open_dataset(path):
+    '''Open a dataset written by save_dataset as a memory-mapped TrafficDataset'''
+    return TrafficDataset(path)
+
+
+
+##### SQL #####
+
+def get_engine(db=TRAFFIC_DB, url=None, **engine_kwargs):
+    """
+    This function will:
+    - build the connection url with env.get_db_url(db), unless a url is given
+      (e.g. 'sqlite:///traffic.db' for a local stand-in)
+    - return the pooled sqlalchemy engine for that url, creating it on first use
+      so every later call shares the same connection pool
+    """
+    if url is None:
+        from env import get_db_url
+        url = get_db_url(db)
+    if url not in _ENGINES:
+        from sqlalchemy import create_engine
+        # mysql drops idle connections, so check them before handing them out
+        engine_kwargs.setdefault('pool_pre_ping', True)
+        _ENGINES[url] = create_engine(url, **engine_kwargs)
+    return _ENGINES[url]
+
+
+def _traffic_where(engine, states, start_time):
+    '''Build the WHERE clause (and its bound params) for the states / start_time filters'''
+    quote = engine.dialect.identifier_preparer.quote
+    where, params = [], {}
+    if states is not None:
+        names = [f'state_{i}' for i in range(len(states))]
+        where.append(f"{quote('State')} IN ({', '.join(':' + n for n in names)})")
+        params.update(zip(names, states))
+    if start_time is not None:
+        where.append(f"{quote('Start_Time')} >= :start_time")
+        params['start_time'] = str(pd.Timestamp(start_time))
+    if not where:
+        return '', params
+    return ' WHERE ' + ' AND '.join(where), params
+
+
+def _traffic_query(engine, table, dtypes, states, start_time):
+    '''Build the projected, filtered select (and its bound params) for the traffic table'''
+    quote = engine.dialect.identifier_preparer.quote
+    cols = ', '.join(quote(col) for col in dtypes)
+    where, params = _traffic_where(engine, states, start_time)
+    return f'SELECT {cols} FROM {quote(table)}{where}', params
+
+
+def read_traffic_sql_chunks(db=TRAFFIC_DB, url=None, table=TRAFFIC_TABLE, query=None, params=None,
+                            chunksize=100_000, states=TRAFFIC_STATES, start_time=None,
+                            dtypes=TRAFFIC_DTYPES, stats=None):
+    """
+    This function will:
+    - select the columns in dtypes from table, filtering on states / start_time in the
+      database (or run query with params instead, if one is given)
+    - stream the result through a server-side cursor, so the whole result set is
+      never buffered client-side
+    - yield chunks of chunksize rows cast to the declared dtypes
+    - count rows in the stats dict, if one is passed
+    """
+    from sqlalchemy import text
+    engine = get_engine(db, url)
+    if query is None:
+        query, params = _traffic_query(engine, table, dtypes, states, start_time)
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True)
+        for chunk in pd.read_sql(text(query), conn, params=params, chunksize=chunksize):
+            # text columns come back as objects already, only cast the typed ones
+            typed = {col: dtype for col, dtype in dtypes.items()
+                     if col in chunk.columns and dtype != 'object'}
+            chunk = chunk.astype(typed)
+            if stats is not None:
+                stats['rows_read'] = stats.get('rows_read', 0) + len(chunk)
+                stats['rows_kept'] = stats.get('rows_kept', 0) + len(chunk)
+            yield chunk
+
+
+def get_traffic_data_sql(db=TRAFFIC_DB, url=None, table=TRAFFIC_TABLE, chunksize=100_000,
+                         states=TRAFFIC_STATES, start_time=None):
+    """
+    This function will:
+    - read the traffic table through read_traffic_sql_chunks
+    - return one dataframe with the same columns and dtypes as get_traffic_data(chunksize=...)
+    """
+    stats = {}
+    chunks = read_traffic_sql_chunks(db, url, table, chunksize=chunksize, states=states,
+                                     start_time=start_time, stats=stats)
+    df = pd.concat(chunks, ignore_index=True)
+    print(f"rows read: {stats.get('rows_read', 0):,}")
+    df.attrs.update(stats)
+    return df
+
+
+
+##### AGGREGATION PUSHDOWN #####
+
+# sql for the month of the start time and the duration in hours, per dialect
+_SQL_MONTH = {
+    'mysql': 'MONTH({start})',
+    'sqlite': "CAST(strftime('%m', {start}) AS INTEGER)",
+    }
+_SQL_DURATION = {
+    'mysql': 'TIMESTAMPDIFF(SECOND, {start}, {end}) / 3600.0',
+    'sqlite': '(julianday({end}) - julianday({start})) * 24.0',
+    }
+
+# aggregate name -> sql, the names match the columns explore builds in pandas
+_SQL_AGGS = {
+    'accident_count': 'COUNT(*)',
+    'mean_duration': 'AVG({duration})',
+    }
+
+
+def _rollup_dims(engine):
+    '''sql expression for every dimension get_rollup can group by'''
+    dialect = engine.dialect.name
+    if dialect not in _SQL_MONTH:
+        raise ValueError(f'no rollup support for the {dialect} dialect')
+    quote = engine.dialect.identifier_preparer.quote
+    month = _SQL_MONTH[dialect].format(start=quote('Start_Time'))
+    # same buckets as prepare.SEASONS
+    season = (f"CASE WHEN {month} IN (12, 1, 2) THEN 'Winter' "
+              f"WHEN {month} IN (3, 4, 5) THEN 'Spring' "
+              f"WHEN {month} IN (6, 7, 8) THEN 'Summer' "
+              f"WHEN {month} IN (9, 10, 11) THEN 'Autumn' ELSE 'Unknown' END")
+    dims = {col.lower(): quote(col) for col in ['State', 'County', 'City', 'Zipcode', 'Severity']}
+    dims.update(month=month, season=season)
+    duration = _SQL_DURATION[dialect].format(start=quote('Start_Time'), end=quote('End_Time'))
+    return dims, duration
+
+
+def get_rollup(by, aggs='accident_count', db=TRAFFIC_DB, url=None, table=TRAFFIC_TABLE,
+               states=TRAFFIC_STATES, start_time=None, top=None):
+    """
+    This function will:
+    - take in a dimension or list of dimensions to group by
+      (state, county, city, zipcode, severity, month, season)
+    - take in an aggregate or list of aggregates (accident_count, mean_duration)
+    - compile them to a GROUP BY query run inside the database, so only the
+      aggregated rows cross the wire
+    - optionally keep only the top groups by the first aggregate
+    - return the rollup as a dataframe
+    """
+    from sqlalchemy import text
+    by = [by] if isinstance(by, str) else list(by)
+    aggs = [aggs] if isinstance(aggs, str) else list(aggs)
+    engine = get_engine(db, url)
+    quote = engine.dialect.identifier_preparer.quote
+    dims, duration = _rollup_dims(engine)
+    unknown = [dim for dim in by if dim not in dims] + [agg for agg in aggs if agg not in _SQL_AGGS]
+    if unknown:
+        raise ValueError(f'cannot roll up: {unknown}')
+    select = [f'{dims[dim]} AS {quote(dim)}' for dim in by]
+    select += [f'{_SQL_AGGS[agg].format(duration=duration)} AS {quote(agg)}' for agg in aggs]
+    where, params = _traffic_where(engine, states, start_time)
+    query = (f"SELECT {', '.join(select)} FROM {quote(table)}{where} "
+             f"GROUP BY {', '.join(dims[dim] for dim in by)}")
+    if top is not None:
+        query += f' ORDER BY {quote(aggs[0])} DESC LIMIT {int(top)}'
+    with engine.connect() as conn:
+        return pd.read_sql(text(query), conn, params=params)
+
+
+
+##### INCREMENTAL PREPARE #####
+
+def _load_incremental(path):
+    '''Read the watermark / running stats metadata of an incremental store (None if new)'''
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def get_incremental_data(filename=TRAFFIC_FILE, cache_dir=CACHE_DIR, chunksize=250_000, outliers=True):
+    """
+    This function will:
+    - keep the prepared table (prep_traffic -> prep_output -> remove_class, and
+      remove_outliers if outliers) in cache_dir/incremental as numbered parquet parts,
+      next to a meta.json with the newest prepared start_time (the watermark), the ids
+      of the rows at the watermark and the running outlier statistics of every
+      prepared row
+    - stream only rows of filename at or after the watermark, prepare just those and
+      drop the ones already taken at the watermark (by id), so rows arriving later
+      with exactly the watermark timestamp are still picked up
+    - merge their outlier statistics into the running ones and filter them with the
+      merged stats, instead of rescanning the history
+    - append them as a new part, move the watermark (taken before the outlier filter,
+      so outliers cannot hold it back) and return the whole table
+    - nothing is written when there are no new rows
+    - earlier parts are not re-filtered, and new rows are appended after the old ones
+      rather than re-sorted into them
+    """
+    import prepare
+    path = os.path.join(cache_dir, 'incremental')
+    os.makedirs(path, exist_ok=True)
+    meta = _load_incremental(path) or {'watermark': None, 'boundary_ids': [], 'parts': 0, 'stats': None}
+    watermark = meta['watermark']
+    stats = {}
+    raw = pd.concat(read_traffic_chunks(filename, chunksize=chunksize, start_time=watermark,
+                                        stats=stats))
+    print(f"rows read: {stats.get('rows_read', 0):,}   rows since watermark: {stats.get('rows_kept', 0):,}")
+    df = prepare.remove_class(prepare.prep_output(prepare.prep_traffic(raw)))
+    if watermark is not None:
+        # the reader bound is inclusive, skip the rows already taken at the watermark
+        seen = (df.index == pd.Timestamp(watermark)) & df['id'].isin(meta.get('boundary_ids', []))
+        df = df[~seen]
+    if not len(df):
+        print(f"no new rows, watermark: {watermark}")
+    else:
+        newest = df.index.max()
+        if not pd.isna(newest):
+            if watermark is None or newest > pd.Timestamp(watermark):
+                meta['watermark'], meta['boundary_ids'] = str(newest), []
+            meta['boundary_ids'] = meta.get('boundary_ids', []) + df.loc[df.index == newest, 'id'].tolist()
+        new_stats = prepare.outlier_stats(df)
+        if meta['stats'] is not None:
+            new_stats = prepare.merge_stats(pd.DataFrame.from_dict(meta['stats'], orient='index'),
+                                            new_stats)
+        if outliers:
+            df = prepare.remove_outliers(df, stats=new_stats)
+        if len(df):
+            df.to_parquet(os.path.join(path, f"part-{meta['parts']:05d}.parquet"))
+            meta['parts'] += 1
+        meta['stats'] = new_stats.to_dict('index')
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        print(f"appended {len(df):,} rows, watermark: {meta['watermark']}")
+    parts = sorted(glob.glob(os.path.join(path, 'part-*.parquet')))
+    return pd.concat([pd.read_parquet(part) for part in parts]) if parts else df
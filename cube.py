@@ -0,0 +1,137 @@
+'''
+Materialized accident count / duration cube for fast rollups
+
+Classes:
+- Cube
+
+Functions:
+- build_cube
+'''
+
+##### IMPORTS #####
+import numpy as np
+import pandas as pd
+
+# dimensions the cube is grouped by, geography first
+CUBE_DIMS = ['state', 'county', 'city', 'zipcode', 'year', 'month', 'day_of_week', 'hour', 'severity']
+GEO_DIMS = ['state', 'county', 'city', 'zipcode']
+# additive measures stored per cell
+CUBE_MEASURES = ['accident_count', 'duration_count', 'total_duration']
+# what rollup can return, computed from the summed measures
+CUBE_AGGS = {
+    'accident_count': lambda t: t['accident_count'],
+    'total_duration': lambda t: t['total_duration'],
+    'mean_duration': lambda t: t['total_duration'] / t['duration_count'],
+}
+
+
+def build_cube(df):
+    """
+    This function will:
+    - take in the prepared frame (prep_traffic output, or prep_output output with
+      start_time as the index and duration in hours)
+    - take month and day_of_week (0=Monday) from the columns add_calendar_features
+      made, and derive year and hour from start_time
+    - group once by every cube dimension and store per cell the accident count, the
+      number of rows with a duration and the summed duration in hours
+    - keep geography as categoricals and the calendar fields as small ints
+    - rows without a start_time are left out
+    - return the Cube
+    """
+    start = df['start_time'] if 'start_time' in df.columns else df.index
+    start = pd.DatetimeIndex(start).to_numpy()
+    if 'duration' in df.columns:
+        hours = df['duration'].to_numpy(dtype=np.float64)
+    else:
+        hours = pd.to_timedelta(df['len_of_affect']).dt.total_seconds().to_numpy() / 3600
+    keep = ~np.isnat(start)
+    start, hours = start[keep], hours[keep]
+
+    day = start.astype('datetime64[D]')
+    keys = {dim: df[dim].to_numpy()[keep] for dim in GEO_DIMS}
+    keys = {dim: pd.Categorical(values) for dim, values in keys.items()}
+    keys['year'] = (start.astype('datetime64[Y]').astype('int64') + 1970).astype(np.int16)
+    # float when add_calendar_features saw missing start times, those rows are gone
+    keys['month'] = df['month'].to_numpy()[keep].astype(np.int8)
+    keys['day_of_week'] = df['day_of_week'].to_numpy()[keep].astype(np.int8)
+    keys['hour'] = ((start - day).astype('timedelta64[h]').astype('int64')).astype(np.int8)
+    keys['severity'] = df['severity'].to_numpy()[keep].astype(np.int8)
+
+    rows = pd.DataFrame(keys)
+    rows['duration'] = hours
+    table = (rows.groupby(CUBE_DIMS, observed=True)['duration']
+                 .agg(accident_count='size', duration_count='count', total_duration='sum')
+                 .reset_index())
+    # groupby hands the int keys back as int64
+    dtypes = {dim: keys[dim].dtype for dim in CUBE_DIMS if dim not in GEO_DIMS}
+    table = table.astype({**dtypes, 'accident_count': np.int32, 'duration_count': np.int32})
+    return Cube(table)
+
+
+class Cube:
+    '''
+    Accident counts and duration sums per (state, county, city, zipcode, year,
+    month, day_of_week, hour, severity) cell.
+
+    Every rollup or top-N sums the cells instead of rescanning the accident rows,
+    answering the same questions as acquire.get_rollup without a database.
+
+    cube = build_cube(df)
+    cube.rollup('city', top=30)
+    cube.rollup(['year', 'month'], ['accident_count', 'mean_duration'], where={'state': 'TX'})
+    '''
+
+    def __init__(self, table):
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def nbytes(self):
+        return int(self.table.memory_usage(deep=True).sum())
+
+    def rollup(self, by=(), aggs='accident_count', where=None, top=None):
+        """
+        This function will:
+        - take in a dimension or list of dimensions to group by (none: grand total)
+        - take in an aggregate or list of aggregates (accident_count, total_duration,
+          mean_duration)
+        - optionally filter cells first with where={dimension: value or list of values}
+        - sum the cells per group and compute the aggregates
+        - optionally keep only the top groups by the first aggregate
+        - return the rollup as a dataframe
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        aggs = [aggs] if isinstance(aggs, str) else list(aggs)
+        unknown = [dim for dim in by if dim not in CUBE_DIMS] + [agg for agg in aggs if agg not in CUBE_AGGS]
+        unknown += [dim for dim in (where or {}) if dim not in CUBE_DIMS]
+        if unknown:
+            raise ValueError(f'cannot roll up: {unknown}')
+        table = self.table
+        if where:
+            mask = np.ones(len(table), dtype=bool)
+            for dim, values in where.items():
+                values = values if isinstance(values, (list, tuple, set)) else [values]
+                mask &= table[dim].isin(values).to_numpy()
+            table = table[mask]
+        if by:
+            sums = table.groupby(by, observed=True)[CUBE_MEASURES].sum()
+        else:
+            sums = pd.DataFrame({measure: [table[measure].sum()] for measure in CUBE_MEASURES})
+        out = pd.DataFrame({agg: CUBE_AGGS[agg](sums) for agg in aggs}, index=sums.index)
+        if top is not None:
+            out = out.nlargest(int(top), aggs[0])
+        return out.reset_index(drop=not by)
+
+    def top(self, dim, n=10, agg='accident_count', where=None):
+        '''The n groups of dim with the largest agg'''
+        return self.rollup(dim, agg, where=where, top=n)
+
+    def save(self, path):
+        '''Write the cube to a parquet file (the categoricals are kept)'''
+        self.table.to_parquet(path)
+
+    @classmethod
+    def load(cls, path):
+        return cls(pd.read_parquet(path))
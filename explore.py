@@ -1,26 +1,29 @@
+import os
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression
-from sklearn.feature_selection import SelectKBest, RFE, f_regression, SequentialFeatureSelector, chi2
-from sklearn.metrics import mean_squared_error
-from scipy import stats
-from sklearn.cluster import KMeans
-from scipy.stats import pearsonr
 
 import acquire as acq
 import prepare as prep
-import pandas as pd
+import outliers
+from lazy import lazy_import
+
+# matplotlib is only imported when a plot is drawn
+plt = lazy_import('matplotlib.pyplot')
 
-df = acq.get_traffic_data()
-df = pd.read_csv('output.csv')
-df = prep.prep_output(df)
-#Remove all classification values
-df = prep.remove_class(df)
 
-train, val, test = prep.split_data(df)
+def load_data():
+    """
+    This function will:
+    - load the prepared data from the typed columnar cache (acquire.get_prepared_data)
+    - run prep_output and remove_class on it
+    - return train, validate and test (this used to run at import time)
+    """
+    # typed columnar cache of the prepared data (rebuilt when the source or prepare changes)
+    df = acq.get_prepared_data()
+    df = prep.prep_output(df)
+    #Remove all classification values
+    df = prep.remove_class(df)
+    return prep.split_data(df)
 
 
 '''
@@ -80,94 +83,238 @@ def nulls_by_row(df):
         - take in a dataframe
         - assign a variable to a Series of total column nulls for ea/row
         - assign a variable to find the percent of columns w/nulls
-        - merges the og df and rows_missing df on the same `customer_id` index
-            - resets the index which in turn creates a new column for the what was previously the index
-        - output a df of the two variables + index.
+        - output a df of the two variables with a positional index.
     """
 
     num_missing = df.isnull().sum(axis=1)
     pct_miss = (num_missing / df.shape[1]) * 100
     
-    rows_missing = pd.DataFrame({'num_cols_missing': num_missing, 'percent_cols_missing': pct_miss})
-    
-    rows_missing = df.merge(rows_missing,
-                        left_index=True,
-                        right_index=True).reset_index()[['num_cols_missing', 'percent_cols_missing']]
+    # positional index, as merging back onto df and resetting the index used to give
+    rows_missing = pd.DataFrame({'num_cols_missing': num_missing.to_numpy(),
+                                 'percent_cols_missing': pct_miss.to_numpy()})
     
     return rows_missing.sort_values(by='num_cols_missing', ascending=False)
 
 
 
-def summarize(df):
+class _Histogram:
+    '''
+    Single-pass histogram with a fixed number of bins: the range starts at the
+    first values seen and doubles (merging bin pairs) whenever later values fall
+    outside it, so no pass is needed to find the min/max first
+    '''
+
+    def __init__(self, bins=20):
+        self.bins = bins + bins % 2
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.lo = None
+        self.width = None
+
+    def _double(self, down):
+        merged = self.counts.reshape(-1, 2).sum(axis=1)
+        empty = np.zeros(self.bins // 2, dtype=np.int64)
+        if down:
+            self.counts = np.concatenate([empty, merged])
+            self.lo -= self.width * self.bins
+        else:
+            self.counts = np.concatenate([merged, empty])
+        self.width *= 2
+
+    def update(self, x):
+        # an inf would make the range grow until the width overflows
+        x = x[np.isfinite(x)]
+        if not len(x):
+            return
+        lo, hi = x.min(), x.max()
+        if self.lo is None:
+            self.lo = lo
+            self.width = (hi - lo) / self.bins or 1.0
+        while lo < self.lo or hi > self.lo + self.width * self.bins:
+            self._double(down=lo < self.lo)
+        idx = np.clip(((x - self.lo) // self.width).astype(np.int64), 0, self.bins - 1)
+        self.counts += np.bincount(idx, minlength=self.bins)
+
+    @property
+    def edges(self):
+        if self.lo is None:
+            return np.zeros(self.bins + 1)
+        return self.lo + self.width * np.arange(self.bins + 1)
+
+
+class Profile:
+    '''
+    Result of profile(): everything summarize reports, from one pass over the data
+
+    - n_rows, dtypes, head (first rows seen)
+    - stats: per column count, nulls, percent null, and for numeric columns
+      mean, std, min, max
+    - histograms: {numeric column: (counts, edges)}
+    - top_values: {text column: top-k value counts} (None if the column had more
+      than max_distinct distinct values)
+    - row_nulls: number of rows by how many of their columns are missing
+    '''
+
+    def __init__(self, n_rows, dtypes, head, stats, histograms, top_values, row_nulls):
+        self.n_rows = n_rows
+        self.dtypes = dtypes
+        self.head = head
+        self.stats = stats
+        self.histograms = histograms
+        self.top_values = top_values
+        self.row_nulls = row_nulls
+
+    def describe(self):
+        '''count / mean / std / min / max of the numeric columns, laid out like df.describe()'''
+        return self.stats.loc[list(self.histograms), ['count', 'mean', 'std', 'min', 'max']].T
+
+    def nulls_by_col(self):
+        '''Same frame as nulls_by_col(df)'''
+        return self.stats[['nulls', 'percent_null']].rename(
+            columns={'nulls': 'num_rows_missing', 'percent_null': 'percent_rows_missing'})
+
+
+def _iter_frames(data, chunksize):
+    '''Chunks of data: slices of a dataframe, frames of an acquire.TrafficDataset, or an iterable of frames'''
+    if isinstance(data, pd.DataFrame):
+        for start in range(0, max(len(data), 1), chunksize):
+            yield data.iloc[start:start + chunksize]
+    elif hasattr(data, 'take') and hasattr(data, 'to_frame'):
+        for start in range(0, max(len(data), 1), chunksize):
+            yield data.take(np.arange(start, min(start + chunksize, len(data)))).to_frame()
+    else:
+        yield from data
+
+
+def profile(data, bins=20, top_k=10, chunksize=500_000, max_distinct=100_000):
+    """
+    This function will:
+    - take in a dataframe, a memory-mapped acquire.TrafficDataset or an iterable
+      of dataframe chunks (e.g. acquire.read_traffic_chunks)
+    - make one pass over it, chunk by chunk, accumulating for every column: null
+      counts, and for numeric columns count / mean / m2 (prepare.outlier_stats per
+      chunk, combined with prepare.merge_stats), min, max and a single-pass
+      histogram; for text columns value counts
+    - return a Profile
+    """
+    n_rows, head, dtypes = 0, None, None
+    nulls, row_nulls = None, {}
+    num_cols, moments, lows, highs, hists, counts = None, None, None, None, {}, {}
+    for chunk in _iter_frames(data, chunksize):
+        if head is None:
+            head, dtypes = chunk.head(3), chunk.dtypes
+            num_cols = [col for col in chunk.columns if pd.api.types.is_numeric_dtype(chunk[col].dtype)]
+            text_cols = [col for col in chunk.columns
+                         if chunk[col].dtype == object or str(chunk[col].dtype) == 'category']
+            nulls = pd.Series(0, index=chunk.columns)
+            counts = {col: pd.Series(dtype='int64') for col in text_cols}
+            hists = {col: _Histogram(bins) for col in num_cols}
+        if not len(chunk):
+            continue
+        n_rows += len(chunk)
+        isna = chunk.isna()
+        nulls += isna.sum()
+        for k, v in isna.sum(axis=1).value_counts().items():
+            row_nulls[k] = row_nulls.get(k, 0) + v
+        # count / mean / m2 of every numeric column, merged like the outlier stats
+        x = chunk[num_cols].to_numpy(dtype=np.float64)
+        chunk_stats = prep.outlier_stats(pd.DataFrame(x, columns=num_cols), num_cols)
+        n = chunk_stats['count'].to_numpy()
+        lo = np.where(n > 0, np.nanmin(np.where(np.isnan(x), np.inf, x), axis=0), np.nan)
+        hi = np.where(n > 0, np.nanmax(np.where(np.isnan(x), -np.inf, x), axis=0), np.nan)
+        if moments is None:
+            moments, lows, highs = chunk_stats, lo, hi
+        else:
+            moments = prep.merge_stats(moments, chunk_stats)
+            lows, highs = np.fmin(lows, lo), np.fmax(highs, hi)
+        for i, col in enumerate(num_cols):
+            hists[col].update(x[:, i])
+        for col in list(counts):
+            if counts[col] is None:
+                continue
+            counts[col] = counts[col].add(chunk[col].value_counts(), fill_value=0)
+            if len(counts[col]) > max_distinct:
+                counts[col] = None
+    stats = pd.DataFrame({'count': n_rows - nulls, 'nulls': nulls,
+                          'percent_null': nulls / max(n_rows, 1) * 100})
+    if moments is not None and num_cols:
+        count = moments['count'].to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(moments['m2'].to_numpy() / (count - 1))
+        num = pd.DataFrame({'mean': np.where(count > 0, moments['mean'], np.nan), 'std': std,
+                            'min': lows, 'max': highs}, index=num_cols)
+        stats = stats.join(num)
+    # categoricals count their unused categories too, leave those out
+    top_values = {col: None if vc is None else vc[vc > 0].astype('int64').sort_values(ascending=False).head(top_k)
+                  for col, vc in counts.items()}
+    histograms = {col: (h.counts, h.edges) for col, h in hists.items()}
+    row_nulls = pd.Series(row_nulls, name='num_rows', dtype='int64').rename_axis('num_cols_missing').sort_index()
+    return Profile(n_rows, dtypes, head, stats, histograms, top_values, row_nulls)
+
+
+def summarize(df, chunksize=500_000):
     '''
-    summarize will take in a single argument (a pandas dataframe) 
+    summarize will take in a single argument (a pandas dataframe, a memory-mapped
+    acquire.TrafficDataset or an iterable of chunks)
     and output to console various statistics on said dataframe, including:
     # .head()
-    # .info()
-    # .describe()
-    # .value_counts()
+    # dtypes and non-null counts
+    # count / mean / std / min / max
+    # top value counts
     # observation of nulls in the dataframe
+    # histograms of the numeric columns
+    all computed by one profile() pass
     '''
+    prof = profile(data=df, chunksize=chunksize)
     print(f"""SUMMARY REPORT
 =====================================================
           
           
 Dataframe head: 
-{df.head(3)}
+{prof.head}
           
 =====================================================
           
           
-Dataframe info: """)
-    df.info()
-
-    print(f"""=====================================================
+Dataframe info: {prof.n_rows:,} rows
+{pd.DataFrame({'dtype': prof.dtypes, 'non_null': prof.stats['count']})}
+=====================================================
           
           
 Dataframe Description: 
-{df.describe()}
+{prof.describe()}
           
 =====================================================
 
 
 nulls in dataframe by column: 
-{nulls_by_col(df)}
+{prof.nulls_by_col()}
 =====================================================
 
 
-nulls in dataframe by row: 
-{nulls_by_row(df)}
+nulls in dataframe by row (rows per number of missing columns): 
+{prof.row_nulls}
 =====================================================
     
     
 DataFrame value counts: 
  """)         
-#     for col in (get_object_cols(df)): 
-#         print(f"""******** {col.upper()} - Value Counts:
-# {df[col].value_counts()}
-#     _______________________________________""")                   
-        
-#     fig, axes = plt.subplots(1, len(get_numeric_cols(df)), figsize=(15, 5))
-    
-#     for i, col in enumerate(get_numeric_cols(df)):
-#         sns.histplot(df[col], ax = axes[i])
-#         axes[i].set_title(f'Histogram of {col}')
-#     plt.show()
-    for col in get_object_cols(df):
+    for col, top in prof.top_values.items():
         print(f"""******** {col.upper()} - Value Counts:
-    {df[col].value_counts()}
+    {'too many distinct values' if top is None else top}
         _______________________________________""")
     
-    num_cols = len(get_numeric_cols(df))
+    num_cols = len(prof.histograms)
+    if not num_cols:
+        return
     num_rows, num_cols_subplot = divmod(num_cols, 3)
     if num_cols_subplot > 0:
         num_rows += 1
     
-    fig, axes = plt.subplots(num_rows, 3, figsize=(15, num_rows * 5))
+    fig, axes = plt.subplots(num_rows, 3, figsize=(15, num_rows * 5), squeeze=False)
     
-    for i, col in enumerate(get_numeric_cols(df)):
+    for i, (col, (counts, edges)) in enumerate(prof.histograms.items()):
         row_idx, col_idx = divmod(i, 3)
-        sns.histplot(df[col], ax=axes[row_idx, col_idx])
+        axes[row_idx, col_idx].stairs(counts, edges, fill=True)
         axes[row_idx, col_idx].set_title(f'Histogram of {col}')
     
     plt.tight_layout()
@@ -233,14 +380,18 @@ def get_upper_outliers(s, m=1.5):
     The values returned will be either 0 (if the point is not an outlier), or a
     number that indicates how far away from the upper bound the observation is.
     '''
-    q1, q3 = s.quantile([.25, 0.75])
-    iqr = q3 - q1
-    upper_bound = q3 + (m * iqr)
+    upper_bound = outliers.iqr_bounds(s.to_frame('s'), m)['upper'].iloc[0]
     
-    return s.apply(lambda x: max([x - upper_bound, 0]))
+    return (s - upper_bound).clip(lower=0)
 
 #put in explore.py file, univariate exploration
-def vis(df): 
+def vis(df, cube=None): 
+    '''cube: a cube.Cube of df, the city counts then come from it instead of the rows'''
+    # the top cities do not depend on the chart, count them once
+    if cube is not None:
+        top_30_city = cube.top('city', 30)
+    else:
+        top_30_city = df['city'].value_counts().head(30).rename_axis('city').reset_index(name='accident_count')
     for col in ['visibility','day_of_week']:
         plt.hist(df[col])
         plt.title(col)
@@ -249,12 +400,7 @@ def vis(df):
         plt.hist(df[col],100)
         plt.title(col)
         plt.show()
-        city_counts = df.groupby('city').size().reset_index(name='accident_count') 
-        # Sort the ZIP codes by accident count in descending order 
-        sorted_city_counts = city_counts.sort_values('accident_count', ascending=False)
-        # Get the top 30 cities with the most accidents 
-        top_30_city = sorted_city_counts.head(30)
-        # Display the top ten ZIP codes and their accident counts 
+        # Display the top 30 cities and their accident counts 
         print(top_30_city)
     
     return plt.show(), print(top_30_city)
@@ -262,114 +408,173 @@ def vis(df):
 
 
 
-def plot_severity_vs_temp(train):
-    # Fit a linear regression model
-    
-    train, val, test = prep.split_data(df)
-    
-    model = LinearRegression()
-    X = train[['temp']]
-    y = train['severity']
-    model.fit(X, y)
+def _severity_edges(y, bins):
+    '''Bin edges for severity: one bin per level when it is discrete, else bins equal bins'''
+    levels = np.unique(y)
+    if len(levels) <= bins:
+        mids = (levels[1:] + levels[:-1]) / 2
+        return np.concatenate([[levels[0] - .5], mids, [levels[-1] + .5]])
+    return np.linspace(levels[0], levels[-1], bins + 1)
 
-    # Make predictions
-    y_pred = model.predict(X)
 
-    # Calculate RMSE
-    rmse = mean_squared_error(y, y_pred, squared=False)
-    
-    corr, p_value = pearsonr(train['temp'], train['severity'])
+def plot_severity_vs(train, feature, label=None, target='severity', bins=200):
+    """
+    This function will:
+    - take in the train dataframe, a numeric feature, its axis label and the number of
+      feature bins
+    - fit the one feature least squares line of target on it and print its Pearson
+      correlation and p-value
+    - count the rows in a feature x severity grid with np.histogram2d and draw the
+      counts (log colour scale) instead of one marker per row, so drawing takes the
+      same time for a thousand rows or ten million
+    - draw the regression line from its two endpoints
+    - return the slope, intercept, rmse, correlation and p-value
+    """
+    from scipy.stats import pearsonr
+
+    label = label or feature
+    data = train[[feature, target]].dropna()
+    x = data[feature].to_numpy(dtype=np.float64)
+    y = data[target].to_numpy(dtype=np.float64)
+
+    # closed form least squares, same fit as LinearRegression on one column
+    x_mean, y_mean = x.mean(), y.mean()
+    slope = ((x - x_mean) @ (y - y_mean)) / ((x - x_mean) @ (x - x_mean))
+    intercept = y_mean - slope * x_mean
+    rmse = np.sqrt(np.mean((y - (intercept + slope * x)) ** 2))
+
+    corr, p_value = pearsonr(x, y)
     print(f'Correlation coefficient: {corr:.3f}')
     print(f'p-value: {p_value:.3f}')
 
-    # Create a scatter plot
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=[bins, _severity_edges(y, bins)])
+    counts = np.ma.masked_equal(counts, 0)
+
+    import matplotlib.colors as colors
     plt.figure(figsize=(10, 6))
-    plt.scatter(train['temp'], train['severity'], alpha=0.5)
-    plt.plot(train['temp'], y_pred, color='red')
-    plt.title(f'Severity vs. Temperature (RMSE: {rmse:.2f})')
-    plt.xlabel('Temperature')
+    mesh = plt.pcolormesh(x_edges, y_edges, counts.T, norm=colors.LogNorm(), cmap='Blues')
+    plt.colorbar(mesh, label='accidents')
+    ends = np.array([x_edges[0], x_edges[-1]])
+    plt.plot(ends, intercept + slope * ends, color='red')
+    plt.title(f'Severity vs. {label} (RMSE: {rmse:.2f})')
+    plt.xlabel(label)
     plt.ylabel('Severity')
     plt.show()
+    return {'slope': slope, 'intercept': intercept, 'rmse': rmse, 'corr': corr, 'p_value': p_value}
 
 
-def plot_severity_vs_wind_speed(train):
-    # Fit a linear regression model
-    model = LinearRegression()
-    X = train[['wind_speed_mph']]
-    y = train['severity']
-    model.fit(X, y)
+def plot_severity_vs_temp(train):
+    return plot_severity_vs(train, 'temp', 'Temperature')
 
-    # Make predictions
-    y_pred = model.predict(X)
 
-    # Calculate RMSE
-    rmse = mean_squared_error(y, y_pred, squared=False)
-    
-    corr, p_value = pearsonr(train['wind_speed_mph'], train['severity'])
-    print(f'Correlation coefficient: {corr:.3f}')
-    print(f'p-value: {p_value:.3f}')
+def plot_severity_vs_wind_speed(train):
+    return plot_severity_vs(train, 'wind_speed_mph', 'Wind Speed (mph)')
 
-    # Create a scatter plot
-    plt.figure(figsize=(10, 6))
-    plt.scatter(train['wind_speed_mph'], train['severity'], alpha=0.5)
-    plt.plot(train['wind_speed_mph'], y_pred, color='red')
-    plt.title(f'Severity vs. Wind Speed (mph) (RMSE: {rmse:.2f})')
-    plt.xlabel('Wind Speed mph')
-    plt.ylabel('Severity')
-    plt.show()
 
 def plot_severity_vs_duration(train):
-    # Fit a linear regression model
-    model = LinearRegression()
-    X = train[['duration']]
-    y = train['severity']
-    model.fit(X, y)
+    return plot_severity_vs(train, 'duration', 'Duration')
 
-    # Make predictions
-    y_pred = model.predict(X)
 
-    # Calculate RMSE
-    rmse = mean_squared_error(y, y_pred, squared=False)
-    
-    corr, p_value = pearsonr(train['duration'], train['severity'])
-    print(f'Correlation coefficient: {corr:.3f}')
-    print(f'p-value: {p_value:.3f}')
-
-    # Create a scatter plot
-    plt.figure(figsize=(10, 6))
-    plt.scatter(train['duration'], train['severity'], alpha=0.5)
-    plt.plot(train['duration'], y_pred, color='red')
-    plt.title(f'Severity vs. Duration (RMSE: {rmse:.2f})')
-    plt.xlabel('Duration')
-    plt.ylabel('Severity')
-    plt.show()
-    
 def plot_severity_vs_pressure(train):
-    # Fit a linear regression model
-    model = LinearRegression()
-    X = train[['pressure']]
-    y = train['severity']
-    model.fit(X, y)
+    return plot_severity_vs(train, 'pressure', 'Atmospheric Pressure')
 
-    # Make predictions
-    y_pred = model.predict(X)
 
-    # Calculate RMSE
-    rmse = mean_squared_error(y, y_pred, squared=False)
-    
-    corr, p_value = pearsonr(train['pressure'], train['severity'])
-    print(f'Correlation coefficient: {corr:.3f}')
-    print(f'p-value: {p_value:.3f}')
+'''
+*------------------*
+|                  |
+|  DRIVER SCREEN   |
+|                  |
+*------------------*
+'''
+
+# arrays the bootstrap workers resample, set once per worker by _boot_init
+_BOOT = {}
+
+
+def _pearson_slope(X, y):
+    '''Pearson r and least squares slope of y on every column of X at once'''
+    Xc = X - X.mean(axis=0)
+    yc = y - y.mean()
+    sxy = Xc.T @ yc
+    sxx = np.einsum('ij,ij->j', Xc, Xc)
+    return sxy / np.sqrt(sxx * (yc @ yc)), sxy / sxx
 
-    # Create a scatter plot
-    plt.figure(figsize=(10, 6))
-    plt.scatter(train['pressure'], train['severity'], alpha=0.5)
-    plt.plot(train['pressure'], y_pred, color='red')
-    plt.title(f'Severity vs. Atmospheric Pressure (RMSE: {rmse:.2f})')
-    plt.xlabel('Atmospheric Pressure')
-    plt.ylabel('Severity')
-    plt.show()
 
-# Call the function
-plot_severity_vs_pressure(train)
+def _boot_init(X, y):
+    _BOOT['X'], _BOOT['y'] = X, y
 
+
+def _boot_task(task):
+    '''Pearson r and slope of n_boot resamples (rows drawn with replacement)'''
+    seed, n_boot = task
+    X, y = _BOOT['X'], _BOOT['y']
+    rng = np.random.default_rng(seed)
+    r, slope = np.empty((n_boot, X.shape[1])), np.empty((n_boot, X.shape[1]))
+    for b in range(n_boot):
+        rows = rng.integers(0, len(y), len(y))
+        r[b], slope[b] = _pearson_slope(X[rows], y[rows])
+    return r, slope
+
+
+def _bootstrap(X, y, n_boot, n_jobs, random_state, task_size=25):
+    # the replicates are cut into fixed tasks with their own seeds, so the
+    # intervals do not depend on n_jobs
+    sizes = [min(task_size, n_boot - i) for i in range(0, n_boot, task_size)]
+    seeds = np.random.SeedSequence(random_state).spawn(len(sizes))
+    tasks = list(zip(seeds, sizes))
+    if n_jobs == 1:
+        _boot_init(X, y)
+        results = [_boot_task(task) for task in tasks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=n_jobs, initializer=_boot_init, initargs=(X, y)) as pool:
+            results = list(pool.map(_boot_task, tasks))
+    return np.concatenate([r for r, _ in results]), np.concatenate([s for _, s in results])
+
+
+def screen_drivers(df, features=None, target='severity', n_boot=0, ci=.95, n_jobs=None, random_state=42):
+    """
+    This function will:
+    - take in a dataframe or a memory-mapped acquire.TrafficDataset, the features to
+      screen (default: every numeric column but the target) and the target
+    - keep the rows where the target and every feature are present
+    - compute for all features at once, with matrix products over the centered
+      columns: Pearson r, Spearman r (Pearson on ranks), their p-values (t test with
+      n - 2 df), and the one feature least squares slope, intercept and rmse
+    - with n_boot > 0, add percentile confidence intervals for r and the slope from
+      n_boot bootstrap resamples, run over n_jobs processes (default: all cores)
+    - return a dataframe indexed by feature, sorted by absolute Pearson r
+    """
+    from scipy import stats
+
+    if features is None:
+        # df[col].dtype works on the dataset handle too (text columns are Categoricals),
+        # bools are left out like select_dtypes('number') does
+        features = [col for col in df.columns if col != target
+                    and pd.api.types.is_numeric_dtype(df[col].dtype)
+                    and not pd.api.types.is_bool_dtype(df[col].dtype)]
+    data = df[list(features) + [target]].dropna()
+    n = len(data)
+    X = data[features].to_numpy(dtype=np.float64)
+    y = data[target].to_numpy(dtype=np.float64)
+
+    def p_values(r):
+        t = r * np.sqrt((n - 2) / np.clip(1 - r ** 2, 1e-300, None))
+        return 2 * stats.t.sf(np.abs(t), n - 2)
+
+    r, slope = _pearson_slope(X, y)
+    ranks = data.rank().to_numpy(dtype=np.float64)
+    rho, _ = _pearson_slope(ranks[:, :-1], ranks[:, -1])
+    intercept = y.mean() - slope * X.mean(axis=0)
+    # residual sum of squares of a one feature fit is Syy (1 - r^2)
+    rmse = np.sqrt(((y - y.mean()) ** 2).sum() * (1 - r ** 2) / n)
+
+    out = pd.DataFrame({'n': n, 'pearson_r': r, 'pearson_p': p_values(r),
+                        'spearman_r': rho, 'spearman_p': p_values(rho),
+                        'slope': slope, 'intercept': intercept, 'rmse': rmse}, index=features)
+    if n_boot:
+        boot_r, boot_slope = _bootstrap(X, y, n_boot, n_jobs or os.cpu_count(), random_state)
+        q = [(1 - ci) / 2, (1 + ci) / 2]
+        out['r_lo'], out['r_hi'] = np.quantile(boot_r, q, axis=0)
+        out['slope_lo'], out['slope_hi'] = np.quantile(boot_slope, q, axis=0)
+    return out.reindex(out['pearson_r'].abs().sort_values(ascending=False).index)
@@ -0,0 +1,61 @@
+'''
+Lazy imports for the heavy plotting and ML libraries
+
+Functions:
+- lazy_import
+- import_time
+- check_import_budget
+'''
+
+##### IMPORTS #####
+import sys
+import importlib
+import subprocess
+
+# seconds a fresh `import explore` / `import modeling` may take
+IMPORT_BUDGET = 1.5
+
+
+class _LazyModule:
+    '''Stand-in for a module that is only imported on first attribute access'''
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+def lazy_import(name):
+    '''
+    Return a stand-in for module name, imported the first time one of its
+    attributes is used, e.g. plt = lazy_import('matplotlib.pyplot')
+    '''
+    return _LazyModule(name)
+
+
+def import_time(module):
+    '''Seconds a fresh interpreter takes to import module'''
+    code = ('import time; t = time.perf_counter(); '
+            f'import {module}; print(time.perf_counter() - t)')
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def check_import_budget(modules=('explore', 'modeling'), budget=IMPORT_BUDGET):
+    """
+    This function will:
+    - time a fresh import of each module
+    - print the times
+    - raise a RuntimeError naming the modules over budget (seconds)
+    """
+    times = {module: import_time(module) for module in modules}
+    for module, seconds in times.items():
+        print(f'import {module}: {seconds:.2f}s (budget {budget:.2f}s)')
+    over = [module for module, seconds in times.items() if seconds > budget]
+    if over:
+        raise RuntimeError(f'import time over the {budget:.2f}s budget: {over}')
+    return times
@@ -5,12 +5,16 @@ Functions:
 - baseline
 - reg_mods_mvp
 - reg_mods
+- best_subsets
 - mvp_model
 - test_mvp_model
 - plt_mvp_err
 - final_model
 - test_model
 - plt_err
+
+Classes:
+- PolyCache
 '''
 
 ########## IMPORTS ##########
@@ -18,20 +22,12 @@ import pandas as pd
 import numpy as np
 import itertools
 
-import matplotlib.pyplot as plt
-import seaborn as sns
-
-from sklearn.metrics import mean_squared_error, r2_score
-from sklearn.linear_model import LinearRegression, LassoLars, TweedieRegressor
-from sklearn.preprocessing import PolynomialFeatures
+from lazy import lazy_import
+from subsets import GramSubsets
+from sweep import run_sweep
 
-import numpy as np
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression, LassoLars, TweedieRegressor
-from sklearn.preprocessing import RobustScaler, PolynomialFeatures
-from sklearn.pipeline import make_pipeline
-from sklearn.metrics import mean_squared_error, r2_score
+# plotting and sklearn are only imported when a function needs them
+plt = lazy_import('matplotlib.pyplot')
 
 
 ######### FUNCTIONS #########
@@ -40,6 +36,7 @@ def metrics_reg(y, y_pred):
     """
     Input y and y_pred & get RMSE, R2
     """
+    from sklearn.metrics import mean_squared_error, r2_score
     rmse = mean_squared_error(y, y_pred, squared=False)
     r2 = r2_score(y, y_pred)
     return round(rmse,2), round(r2,4)
@@ -49,6 +46,7 @@ def baseline(ytr,yv):
     The function calculates and prints the baseline metrics of a model
     that always predicts the mean in the target variable.
     """
+    from sklearn.metrics import mean_squared_error, r2_score
     pred_mean = ytr.mean()[0]
     ytr_p = ytr.assign(pred_mean=pred_mean)
     yv_p = yv.assign(pred_mean=pred_mean)
@@ -60,139 +58,123 @@ def baseline(ytr,yv):
     print(f'Train       RMSE: {rmse_tr}   R2: {r2_tr}')
     print(f'Validate    RMSE: {rmse_v}    R2: {r2_v}')
 
-def reg_mods_mvp(Xtr,ytr,Xv,yv,features=None,alpha=1,degree=2,power=2):
+class PolyCache:
     '''
-    Input X_train,y_train,X_val,y_val, list of features, and alpha, degree, and power
-    so that function will run through linear regression, lasso lars,
-    polynomial feature regression, and tweedie regressor (glm)
-    - diff feature combos
-    - diff hyper params
-    - output as df
+    PolynomialFeatures expansions of the full feature set, computed once per
+    (frame, degree) and shared by every feature subset.
+
+    A subset's design is a column selection of the full expansion: its terms are
+    found through PolynomialFeatures.powers_, in the order fit_transform on the
+    subset gives them, so models fit on it match the per-subset expansion.
+    Expansions grow as C(features + degree, degree) columns, dtype=np.float32
+    halves them.
+
+    cache = PolyCache({'tr': Xtr, 'v': Xv}, features)
+    Xtr_pf = cache.design('tr', ['beds_s', 'area_s'], 2)
     '''
-    if features is None:
-        features = Xtr.columns.to_list()
-    # baseline as mean
-    pred_mean = ytr.mean()[0]
-    ytr_p = ytr.assign(pred_mean=pred_mean)
-    yv_p = yv.assign(pred_mean=pred_mean)
-    rmse_tr = mean_squared_error(ytr,ytr_p.pred_mean)**.5
-    rmse_v = mean_squared_error(yv,yv_p.pred_mean)**.5
-    r2_tr = r2_score(ytr, ytr_p.pred_mean)
-    r2_v = r2_score(yv, yv_p.pred_mean)
-    output = {
-            'model':'bl_mean',
-            'features':'None',
-            'params':'None',
+
+    def __init__(self, frames, features=None, dtype=np.float64):
+        self.frames = frames
+        self.features = list(features if features is not None else next(iter(frames.values())).columns)
+        self.dtype = dtype
+        self._expanded = {}
+        self._powers = {}
+
+    def full(self, name, degree):
+        '''Expansion of every feature of frame name'''
+        from sklearn.preprocessing import PolynomialFeatures
+        key = (name, degree)
+        if key not in self._expanded:
+            X = self.frames[name][self.features].to_numpy(dtype=self.dtype)
+            self._expanded[key] = PolynomialFeatures(degree=degree).fit_transform(X).astype(self.dtype, copy=False)
+        return self._expanded[key]
+
+    def columns(self, f, degree):
+        '''Positions of the terms of features f in the full expansion, in subset order'''
+        from sklearn.preprocessing import PolynomialFeatures
+        if degree not in self._powers:
+            powers = PolynomialFeatures(degree=degree).fit(np.zeros((1,len(self.features)))).powers_
+            self._powers[degree] = {tuple(p): i for i, p in enumerate(powers)}
+        sub = PolynomialFeatures(degree=degree).fit(np.zeros((1,len(f)))).powers_
+        exponents = np.zeros((len(sub),len(self.features)),dtype=int)
+        exponents[:,[self.features.index(c) for c in f]] = sub
+        return [self._powers[degree][tuple(e)] for e in exponents]
+
+    def design(self, name, f, degree):
+        '''Polynomial design of features f for frame name, like PolynomialFeatures(degree).fit_transform'''
+        return self.full(name,degree)[:,self.columns(f,degree)]
+
+# fitted (PolynomialFeatures, LinearRegression) pairs by features, degree and training data
+_POLY_MODELS = {}
+
+def _fit_poly(X_train,y_train,f,degree):
+    '''
+    PolynomialFeatures(degree) + LinearRegression fit on X_train[f], memoized so
+    the test and plot functions reuse the model instead of refitting it
+    '''
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import PolynomialFeatures
+    data = pd.util.hash_pandas_object(X_train[f]).sum(), pd.util.hash_pandas_object(y_train).sum()
+    key = (tuple(f),degree,data)
+    if key not in _POLY_MODELS:
+        pf = PolynomialFeatures(degree=degree)
+        pr = LinearRegression()
+        pr.fit(pf.fit_transform(X_train[f]),y_train)
+        _POLY_MODELS[key] = pf, pr
+    return _POLY_MODELS[key]
+
+def _fit_row(task,Xtr,ytr,Xv,yv,**poly):
+    '''
+    Fit one (model, features, params label, params) task of a reg_mods sweep
+    and return its table row; polynomial tasks select params['columns'] from
+    the cached expansions poly['Ptr<degree>'] / poly['Pv<degree>']
+    '''
+    from sklearn.linear_model import LinearRegression, TweedieRegressor
+    model, f, label, params = task
+    Xtr_f, Xv_f, target = Xtr[f], Xv[f], ytr
+    if model == 'PolynomialFeature':
+        d = params['degree']
+        Xtr_f = poly[f'Ptr{d}'].to_numpy()[:,params['columns']]
+        Xv_f = poly[f'Pv{d}'].to_numpy()[:,params['columns']]
+        est = LinearRegression()
+    elif model == 'TweedieRegressor':
+        est = TweedieRegressor(power=params['power'],alpha=params['alpha'])
+        # the glm wants a 1d target
+        target = np.ravel(ytr)
+    else:
+        raise ValueError(f'unknown sweep model: {model}')
+    est.fit(Xtr_f,target)
+    # metrics
+    rmse_tr,r2_tr = metrics_reg(ytr,est.predict(Xtr_f))
+    rmse_v,r2_v = metrics_reg(yv,est.predict(Xv_f))
+    # table-ize
+    return {
+            'model':model,
+            'features':f,
+            'params':label,
             'rmse_tr':rmse_tr,
             'rmse_v':rmse_v,
             'r2_tr':r2_tr,
             'r2_v':r2_v
         }
-    metrics = [output]
-    # create iterable for feature combos
-    for r in range(1,(len(features)+1)):
-        # cycle through feature combos for linear reg
-        for feature in itertools.combinations(features,r):
-            f = list(feature)
-            # linear regression
-            lr = LinearRegression()
-            lr.fit(Xtr[f],ytr)
-            # metrics
-            pred_lr_tr = lr.predict(Xtr[f])
-            rmse_tr,r2_tr = metrics_reg(ytr,pred_lr_tr)
-            pred_lr_v = lr.predict(Xv[f])
-            rmse_v,r2_v = metrics_reg(yv,pred_lr_v)
-            # table-ize
-            output ={
-                    'model':'LinearRegression',
-                    'features':f,
-                    'params':'None',
-                    'rmse_tr':rmse_tr,
-                    'rmse_v':rmse_v,
-                    'r2_tr':r2_tr,
-                    'r2_v':r2_v
-                }
-            metrics.append(output)
-        # cycle through feature combos and alphas for lasso lars
-        for feature,a in itertools.product(itertools.combinations(features,r),alpha):
-            f = list(feature)
-            # lasso lars
-            ll = LassoLars(alpha=a,normalize=False,random_state=42)
-            ll.fit(Xtr[f],ytr)
-            # metrics
-            pred_ll_tr = ll.predict(Xtr[f])
-            rmse_tr,r2_tr = metrics_reg(ytr,pred_ll_tr)
-            pred_ll_v = ll.predict(Xv[f])
-            rmse_v,r2_v = metrics_reg(yv,pred_ll_v)
-            # table-ize
-            output ={
-                    'model':'LassoLars',
-                    'features':f,
-                    'params':f'alpha={a}',
-                    'rmse_tr':rmse_tr,
-                    'rmse_v':rmse_v,
-                    'r2_tr':r2_tr,
-                    'r2_v':r2_v
-                }
-            metrics.append(output)
-        # cycle through feature combos and degrees for polynomial feature reg
-        for feature,d in itertools.product(itertools.combinations(features,r),degree):
-            f = list(feature)
-            # polynomial feature regression
-            pf = PolynomialFeatures(degree=d)
-            Xtr_pf = pf.fit_transform(Xtr[f])
-            Xv_pf = pf.transform(Xv[f])
-            lp = LinearRegression()
-            lp.fit(Xtr_pf,ytr)
-            # metrics
-            pred_lp_tr = lp.predict(Xtr_pf)
-            rmse_tr,r2_tr = metrics_reg(ytr,pred_lp_tr)
-            pred_lp_v = lp.predict(Xv_pf)
-            rmse_v,r2_v = metrics_reg(yv,pred_lp_v)
-            # table-ize
-            output ={
-                    'model':'PolynomialFeature',
-                    'features':f,
-                    'params':f'degree={d}',
-                    'rmse_tr':rmse_tr,
-                    'rmse_v':rmse_v,
-                    'r2_tr':r2_tr,
-                    'r2_v':r2_v
-                }
-            metrics.append(output)
-        # cycle through feature combos, alphas, and powers for tweedie reg
-        for feature,a,p in itertools.product(itertools.combinations(features,r),alpha,power):
-            f = list(feature)
-            # tweedie regressor glm
-            lm = TweedieRegressor(power=p,alpha=a)
-            lm.fit(Xtr[f],ytr.prop_value)
-            # metrics
-            pred_lm_tr = lm.predict(Xtr[f])
-            rmse_tr,r2_tr = metrics_reg(ytr,pred_lm_tr)
-            pred_lm_v = lm.predict(Xv[f])
-            rmse_v,r2_v = metrics_reg(yv,pred_lm_v)
-            # table-ize
-            output ={
-                    'model':'TweedieRegressor',
-                    'features':f,
-                    'params':f'power={p},alpha={a}',
-                    'rmse_tr':rmse_tr,
-                    'rmse_v':rmse_v,
-                    'r2_tr':r2_tr,
-                    'r2_v':r2_v
-                }
-            metrics.append(output)
-    return pd.DataFrame(metrics)
 
-def reg_mods(Xtr,ytr,Xv,yv,features=None,alpha=1,degree=2):
+def reg_mods_mvp(Xtr,ytr,Xv,yv,features=None,alpha=1,degree=2,power=2,n_jobs=1,poly_dtype=np.float64):
     '''
-    Input X_train,y_train,X_val,y_val, list of features, alpha, and degree
-    so that function will run through linear regression, lasso lars, and
-    polynomial feature regression
+    Input X_train,y_train,X_val,y_val, list of features, and alpha, degree, and power
+    so that function will run through linear regression, lasso lars,
+    polynomial feature regression, and tweedie regressor (glm)
     - diff feature combos
     - diff hyper params
+    - linear reg and lasso lars (one lars path per feature combo, read at every
+      alpha) are solved from the train / validate gram matrices
+    - polynomial and tweedie fits fan out over n_jobs processes (None: all cores)
+      attached to the data through shared memory
+    - polynomial designs are column selections of one expansion of all features
+      per degree (poly_dtype=np.float32 halves it)
+    - rows come back in the same order whatever n_jobs is
     - output as df
     '''
+    from sklearn.metrics import mean_squared_error, r2_score
     if features is None:
         features = Xtr.columns.to_list()
     # baseline as mean
@@ -213,82 +195,40 @@ def reg_mods(Xtr,ytr,Xv,yv,features=None,alpha=1,degree=2):
             'r2_v':r2_v
         }
     metrics = [output]
-    # create iterable for feature combos
+    # XᵀX / Xᵀy of train and validate, computed once for every linear reg subset
+    gram = GramSubsets(Xtr,ytr,Xv,yv,features)
+    # full polynomial expansion per degree, shared with the workers
+    cache = PolyCache({'tr':Xtr,'v':Xv},features,dtype=poly_dtype)
+    poly = {}
+    for d in degree:
+        poly[f'Ptr{d}'] = pd.DataFrame(cache.full('tr',d))
+        poly[f'Pv{d}'] = pd.DataFrame(cache.full('v',d))
+    # every polynomial and tweedie fit as a task, in table order
+    tasks, per_size = [], []
     for r in range(1,(len(features)+1)):
-        # cycle through feature combos for linear reg
-        for feature in itertools.combinations(features,r):
-            f = list(feature)
-            # linear regression
-            lr = LinearRegression()
-            lr.fit(Xtr[f],ytr)
-            # metrics
-            pred_lr_tr = lr.predict(Xtr[f])
-            rmse_tr,r2_tr = metrics_reg(ytr,pred_lr_tr)
-            pred_lr_v = lr.predict(Xv[f])
-            rmse_v,r2_v = metrics_reg(yv,pred_lr_v)
-            # table-ize
-            output ={
-                    'model':'LinearRegression',
-                    'features':f,
-                    'params':'None',
-                    'rmse_tr':rmse_tr,
-                    'rmse_v':rmse_v,
-                    'r2_tr':r2_tr,
-                    'r2_v':r2_v
-                }
-            metrics.append(output)
-        # cycle through feature combos and alphas for lasso lars
-        for feature,a in itertools.product(itertools.combinations(features,r),alpha):
-            f = list(feature)
-            # lasso lars
-            ll = LassoLars(alpha=a,normalize=False,random_state=42)
-            ll.fit(Xtr[f],ytr)
-            # metrics
-            pred_ll_tr = ll.predict(Xtr[f])
-            rmse_tr,r2_tr = metrics_reg(ytr,pred_ll_tr)
-            pred_ll_v = ll.predict(Xv[f])
-            rmse_v,r2_v = metrics_reg(yv,pred_ll_v)
-            # table-ize
-            output ={
-                    'model':'LassoLars',
-                    'features':f,
-                    'params':f'alpha={a}',
-                    'rmse_tr':rmse_tr,
-                    'rmse_v':rmse_v,
-                    'r2_tr':r2_tr,
-                    'r2_v':r2_v
-                }
-            metrics.append(output)
-        # cycle through feature combos and degrees for polynomial feature reg
-        for feature,d in itertools.product(itertools.combinations(features,r),degree):
-            f = list(feature)
-            # polynomial feature regression
-            pf = PolynomialFeatures(degree=d)
-            Xtr_pf = pf.fit_transform(Xtr[f])
-            Xv_pf = pf.transform(Xv[f])
-            lp = LinearRegression()
-            lp.fit(Xtr_pf,ytr)
-            # metrics
-            pred_lp_tr = lp.predict(Xtr_pf)
-            rmse_tr,r2_tr = metrics_reg(ytr,pred_lp_tr)
-            pred_lp_v = lp.predict(Xv_pf)
-            rmse_v,r2_v = metrics_reg(yv,pred_lp_v)
-            # table-ize
-            output ={
-                    'model':'PolynomialFeature',
-                    'features':f,
-                    'params':f'degree={d}',
-                    'rmse_tr':rmse_tr,
-                    'rmse_v':rmse_v,
-                    'r2_tr':r2_tr,
-                    'r2_v':r2_v
-                }
-            metrics.append(output)
+        combos = [list(f) for f in itertools.combinations(features,r)]
+        size_tasks = [('PolynomialFeature',f,f'degree={d}',{'degree':d,'columns':cache.columns(f,d)})
+                      for f,d in itertools.product(combos,degree)]
+        size_tasks += [('TweedieRegressor',f,f'power={p},alpha={a}',{'power':p,'alpha':a})
+                       for f,a,p in itertools.product(combos,alpha,power)]
+        tasks += size_tasks
+        per_size.append((r,len(size_tasks)))
+    frames = {'Xtr':Xtr[features],'ytr':ytr,'Xv':Xv[features],'yv':yv,**poly}
+    rows = run_sweep(_fit_row,tasks,frames,n_jobs=n_jobs)
+    # linear reg and lasso lars rows (from the gram matrices) first for each
+    # number of features, then that size's sweep rows
+    start = 0
+    for r,n in per_size:
+        metrics.extend(gram.rows(r))
+        metrics.extend(gram.lasso_rows(r,alpha))
+        metrics.extend(rows[start:start+n])
+        start += n
     return pd.DataFrame(metrics)
 
 def mvp_model(model,X_train,y_train,X_val,y_val):
     '''Input model type along with train and validate data and
     it will return RMSE and R2 results per the selected model'''
+    from sklearn.linear_model import LinearRegression, LassoLars, TweedieRegressor
     if model == 'lr':
         # features
         f=['baths_s', 'beds_s', 'area_s', 'rooms_s']
@@ -306,13 +246,10 @@ def mvp_model(model,X_train,y_train,X_val,y_val):
     elif model == 'poly':
         # features
         f=['baths_s', 'beds_s', 'area_s']
-        # polynomial feature regression
-        pf = PolynomialFeatures(degree=2)
-        X_train_pf = pf.fit_transform(X_train[f])
+        # polynomial feature regression, fit once and reused by the test / plot functions
+        pf, pr = _fit_poly(X_train,y_train,f,2)
+        X_train_pf = pf.transform(X_train[f])
         X_val_pf = pf.transform(X_val[f])
-        # model
-        pr = LinearRegression()
-        pr.fit(X_train_pf,y_train)
         # metrics
         pred_pr_tr = pr.predict(X_train_pf)
         rmse_tr,r2_tr = metrics_reg(y_train,pred_pr_tr)
@@ -356,13 +293,9 @@ def test_mvp_model(X_train,y_train,X_test,y_test):
     '''Input train and test data and it will return RMSE and R2 test results'''
     # features
     f=['baths_s', 'beds_s', 'area_s']
-    # polynomial feature regression
-    pf = PolynomialFeatures(degree=2)
-    X_train_pf = pf.fit_transform(X_train[f])
+    # polynomial feature regression, fit once and reused by the test / plot functions
+    pf, pr = _fit_poly(X_train,y_train,f,2)
     X_test_pf = pf.transform(X_test[f])
-    # model
-    pr = LinearRegression()
-    pr.fit(X_train_pf,y_train)
     # metrics
     pred_pr_t = pr.predict(X_test_pf)
     rmse_t,r2_t = metrics_reg(y_test,pred_pr_t)
@@ -373,13 +306,9 @@ def plt_mvp_err(Xs_train,y_train,Xs_test,y_test):
     '''plot predicted vs actual property values by inputting train and test'''
     # features
     f=['baths_s', 'beds_s', 'area_s']
-    # polynomial feature regression
-    pf = PolynomialFeatures(degree=2)
-    X_train_pf = pf.fit_transform(Xs_train[f])
+    # polynomial feature regression, fit once and reused by the test / plot functions
+    pf, pr = _fit_poly(Xs_train,y_train,f,2)
     X_test_pf = pf.transform(Xs_test[f])
-    # model
-    pr = LinearRegression()
-    pr.fit(X_train_pf,y_train)
     # metrics
     pred_pr_t = pd.DataFrame(pr.predict(X_test_pf),index=y_test.index,columns=['y_pred'])
     pred_mean = y_test
@@ -399,6 +328,7 @@ def plt_mvp_err(Xs_train,y_train,Xs_test,y_test):
 def final_model(model,X_train,y_train,X_val,y_val):
     '''Input model type along with train and validate data and
     it will return RMSE and R2 results per the selected model'''
+    from sklearn.linear_model import LinearRegression, LassoLars
     if model == 'lr':
         # features
         f=['baths_s', 'beds_s', 'roomcnt_s', 'area_s', 'latitude_s', 'longitude_s', 'LA_s', 'Ventura_s', 'age_s']
@@ -416,13 +346,10 @@ def final_model(model,X_train,y_train,X_val,y_val):
     elif model == 'poly':
         # features
         f=['beds_s', 'area_s', 'latitude_s', 'longitude_s', 'LA_s', 'Ventura_s', 'age_s']
-        # polynomial feature regression
-        pf = PolynomialFeatures(degree=4)
-        X_train_pf = pf.fit_transform(X_train[f])
+        # polynomial feature regression, fit once and reused by the test / plot functions
+        pf, pr = _fit_poly(X_train,y_train,f,4)
+        X_train_pf = pf.transform(X_train[f])
         X_val_pf = pf.transform(X_val[f])
-        # model
-        pr = LinearRegression()
-        pr.fit(X_train_pf,y_train)
         # metrics
         pred_pr_tr = pr.predict(X_train_pf)
         rmse_tr,r2_tr = metrics_reg(y_train,pred_pr_tr)
@@ -452,13 +379,9 @@ def test_model(X_train,y_train,X_test,y_test):
     '''Input train and test data and it will return RMSE and R2 test results'''
     # features
     f=['beds_s', 'area_s', 'latitude_s', 'longitude_s', 'LA_s', 'Ventura_s', 'age_s']
-    # polynomial feature regression
-    pf = PolynomialFeatures(degree=4)
-    X_train_pf = pf.fit_transform(X_train[f])
+    # polynomial feature regression, fit once and reused by the test / plot functions
+    pf, pr = _fit_poly(X_train,y_train,f,4)
     X_test_pf = pf.transform(X_test[f])
-    # model
-    pr = LinearRegression()
-    pr.fit(X_train_pf,y_train)
     # metrics
     pred_pr_t = pr.predict(X_test_pf)
     rmse_t,r2_t = metrics_reg(y_test,pred_pr_t)
@@ -469,13 +392,9 @@ def plt_err(Xs_train,y_train,Xs_test,y_test):
     '''plot predicted vs actual property values by inputting train and test'''
     # features
     f=['beds_s', 'area_s', 'latitude_s', 'longitude_s', 'LA_s', 'Ventura_s', 'age_s']
-    # polynomial feature regression
-    pf = PolynomialFeatures(degree=4)
-    X_train_pf = pf.fit_transform(Xs_train[f])
+    # polynomial feature regression, fit once and reused by the test / plot functions
+    pf, pr = _fit_poly(Xs_train,y_train,f,4)
     X_test_pf = pf.transform(Xs_test[f])
-    # model
-    pr = LinearRegression()
-    pr.fit(X_train_pf,y_train)
     # metrics
     pred_pr_t = pd.DataFrame(pr.predict(X_test_pf),index=y_test.index,columns=['y_pred'])
     pred_mean = y_test
@@ -491,8 +410,6 @@ def plt_err(Xs_train,y_train,Xs_test,y_test):
     plt.ylabel("Predicted Property Value ($ Millions)")
     plt.title("Where are predictions more extreme? More modest?")
     plt.show()
-    
-    from sklearn.preprocessing import RobustScaler
 
 def robs(train, validate, test, scale=None):
     """
@@ -509,6 +426,7 @@ def robs(train, validate, test, scale=None):
     :return: three dataframes: Xtr (scaled training data), Xv (scaled validation data), and Xt (scaled
     test data).
     """
+    from sklearn.preprocessing import RobustScaler
     if scale is None:
         scale = train.columns.to_list()
     scale = [col for col in scale if col != 'severity']
@@ -528,15 +446,20 @@ Xtr_s,Xv_s,Xt_s = robs(Xtr,Xv,Xt)
 ytr,yv,yt = train[['severity']],val[['severity']],test[['severity']]
 Xtr_s.sample(1)"""
 
-def reg_mods(Xtr,ytr,Xv,yv,features=None,alpha=1,degree=2):
+def reg_mods(Xtr,ytr,Xv,yv,features=None,alpha=1,degree=2,poly_dtype=np.float64):
     '''
     Input X_train,y_train,X_val,y_val, list of features, alpha, and degree
     so that function will run through linear regression, lasso lars, and
     polynomial feature regression
     - diff feature combos
     - diff hyper params
+    - lasso lars computes one lars path per feature combo and reads every alpha off it
+    - polynomial designs are column selections of one expansion of all features
+      per degree (poly_dtype=np.float32 halves it)
     - output as df
     '''
+    from sklearn.linear_model import LinearRegression
+    from sklearn.metrics import mean_squared_error, r2_score
     if features is None:
         features = Xtr.columns.to_list()
     # baseline as mean
@@ -557,59 +480,22 @@ def reg_mods(Xtr,ytr,Xv,yv,features=None,alpha=1,degree=2):
             'r2_v':r2_v
         }
     metrics = [output]
+    # XᵀX / Xᵀy of train and validate, computed once for every linear reg subset
+    gram = GramSubsets(Xtr,ytr,Xv,yv,features)
+    # every feature expanded once per degree, combos select their columns
+    cache = PolyCache({'tr':Xtr,'v':Xv},features,dtype=poly_dtype)
     # create iterable for feature combos
     for r in range(1,(len(features)+1)):
-        # cycle through feature combos for linear reg
-        for feature in itertools.combinations(features,r):
-            f = list(feature)
-            # linear regression
-            lr = LinearRegression()
-            lr.fit(Xtr[f],ytr)
-            # metrics
-            pred_lr_tr = lr.predict(Xtr[f])
-            rmse_tr,r2_tr = metrics_reg(ytr,pred_lr_tr)
-            pred_lr_v = lr.predict(Xv[f])
-            rmse_v,r2_v = metrics_reg(yv,pred_lr_v)
-            # table-ize
-            output ={
-                    'model':'LinearRegression',
-                    'features':f,
-                    'params':'None',
-                    'rmse_tr':rmse_tr,
-                    'rmse_v':rmse_v,
-                    'r2_tr':r2_tr,
-                    'r2_v':r2_v
-                }
-            metrics.append(output)
-        # cycle through feature combos and alphas for lasso lars
-        for feature,a in itertools.product(itertools.combinations(features,r),alpha):
-            f = list(feature)
-            # lasso lars
-            ll = LassoLars(alpha=a,normalize=False,random_state=42)
-            ll.fit(Xtr[f],ytr)
-            # metrics
-            pred_ll_tr = ll.predict(Xtr[f])
-            rmse_tr,r2_tr = metrics_reg(ytr,pred_ll_tr)
-            pred_ll_v = ll.predict(Xv[f])
-            rmse_v,r2_v = metrics_reg(yv,pred_ll_v)
-            # table-ize
-            output ={
-                    'model':'LassoLars',
-                    'features':f,
-                    'params':f'alpha={a}',
-                    'rmse_tr':rmse_tr,
-                    'rmse_v':rmse_v,
-                    'r2_tr':r2_tr,
-                    'r2_v':r2_v
-                }
-            metrics.append(output)
+        # linear reg for every feature combo, solved from the gram matrices
+        metrics.extend(gram.rows(r))
+        # lasso lars for every feature combo and alpha, one lars path per combo
+        metrics.extend(gram.lasso_rows(r,alpha))
         # cycle through feature combos and degrees for polynomial feature reg
         for feature,d in itertools.product(itertools.combinations(features,r),degree):
             f = list(feature)
             # polynomial feature regression
-            pf = PolynomialFeatures(degree=d)
-            Xtr_pf = pf.fit_transform(Xtr[f])
-            Xv_pf = pf.transform(Xv[f])
+            Xtr_pf = cache.design('tr',f,d)
+            Xv_pf = cache.design('v',f,d)
             lp = LinearRegression()
             lp.fit(Xtr_pf,ytr)
             # metrics
@@ -628,12 +514,25 @@ def reg_mods(Xtr,ytr,Xv,yv,features=None,alpha=1,degree=2):
                     'r2_v':r2_v
                 }
             metrics.append(output)
-    return pd.DataFrame(metric)
+    return pd.DataFrame(metrics)
+
+def best_subsets(Xtr,ytr,Xv,yv,features=None,top=5,max_size=None):
+    '''
+    Input X_train,y_train,X_val,y_val, list of features, how many subsets to keep
+    per size and the largest size, and get the top linear regression subsets of
+    every size by train RMSE
+    - branch and bound instead of every feature combo, so 30+ features are searchable
+    - same rows and columns as the LinearRegression rows of reg_mods
+    - output as df
+    '''
+    gram = GramSubsets(Xtr,ytr,Xv,yv,features)
+    return pd.DataFrame(gram.best(top=top,max_size=max_size))
 
 def metrics_reg(y, y_pred):
     """
     Input y and y_pred & get RMSE, R2
     """
+    from sklearn.metrics import mean_squared_error, r2_score
     rmse = mean_squared_error(y, y_pred, squared=False)
     r2 = r2_score(y, y_pred)
     return round(rmse,2), round(r2,4)
@@ -641,6 +540,11 @@ def metrics_reg(y, y_pred):
 
 
 def run_models(df):
+    from sklearn.linear_model import LinearRegression, LassoLars, TweedieRegressor
+    from sklearn.metrics import mean_squared_error, r2_score
+    from sklearn.model_selection import train_test_split
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import PolynomialFeatures, RobustScaler
     # Convert 'duration' from string format to total minutes
     df['duration'] = pd.to_timedelta(df['duration']).dt.total_seconds() / 60
 
@@ -0,0 +1,168 @@
+'''
+Outlier detection for the numeric accident columns
+
+Functions:
+- iqr_bounds
+- upper_outliers
+- lower_outliers
+- flag_outliers
+- sketch_columns
+- sketch_bounds
+
+Classes:
+- QuantileSketch
+'''
+
+##### IMPORTS #####
+import numpy as np
+import pandas as pd
+
+
+##### EXACT #####
+
+def _bounds(q1, q3, m):
+    '''IQR bounds frame from the quartiles of each column'''
+    iqr = q3 - q1
+    return pd.DataFrame({'q1': q1, 'q3': q3, 'lower': q1 - m * iqr, 'upper': q3 + m * iqr})
+
+
+def iqr_bounds(df, m=1.5, columns=None):
+    """
+    This function will:
+    - take in a dataframe, the IQR multiplier m and optionally the columns to use
+      (default: every numeric column)
+    - compute the quartiles of all of them in one quantile call
+    - return a frame indexed by column with q1, q3, lower and upper bounds
+    """
+    if columns is None:
+        columns = df.select_dtypes('number').columns
+    q = df[columns].quantile([.25, .75])
+    return _bounds(q.loc[.25], q.loc[.75], m)
+
+
+def upper_outliers(df, m=1.5, bounds=None):
+    '''
+    How far each value is above its column's upper bound (0 if it is not an
+    upper outlier), for every numeric column at once; bounds defaults to
+    iqr_bounds(df, m) and can come from sketch_bounds instead
+    '''
+    if bounds is None:
+        bounds = iqr_bounds(df, m)
+    cols = list(bounds.index)
+    x = df[cols].to_numpy(dtype=np.float64)
+    return pd.DataFrame(np.clip(x - bounds['upper'].to_numpy(), 0, None), index=df.index, columns=cols)
+
+
+def lower_outliers(df, m=1.5, bounds=None):
+    '''How far each value is below its column's lower bound (0 if it is not a lower outlier)'''
+    if bounds is None:
+        bounds = iqr_bounds(df, m)
+    cols = list(bounds.index)
+    x = df[cols].to_numpy(dtype=np.float64)
+    return pd.DataFrame(np.clip(bounds['lower'].to_numpy() - x, 0, None), index=df.index, columns=cols)
+
+
+def flag_outliers(df, bounds):
+    '''Boolean frame, True where a value is outside its column's [lower, upper] bounds'''
+    cols = list(bounds.index)
+    x = df[cols].to_numpy(dtype=np.float64)
+    flags = (x < bounds['lower'].to_numpy()) | (x > bounds['upper'].to_numpy())
+    return pd.DataFrame(flags, index=df.index, columns=cols)
+
+
+##### APPROXIMATE #####
+
+class QuantileSketch:
+    '''
+    KLL-style approximate quantile sketch with bounded memory.
+
+    Values go into level 0; when a level holds more than its capacity it is
+    sorted and every other value (random offset) moves up a level, where each
+    value stands for twice as many. Capacities shrink geometrically towards the
+    lower levels, so the sketch keeps about 3 * k values whatever the row count,
+    and two sketches of separate partitions merge into a sketch of both.
+
+    - update(values): add an array of values (NaNs are ignored)
+    - merge(other): fold another sketch into this one
+    - quantile(q): approximate quantile(s)
+    '''
+
+    def __init__(self, k=200, seed=42):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - 1 - level
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            if len(self.levels[level]) > self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                values = np.sort(self.levels[level])
+                # an odd value out stays behind at this level
+                keep = values[:len(values) % 2]
+                values = values[len(values) % 2:]
+                promoted = values[self._rng.integers(2)::2]
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+                self.levels[level] = keep
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        for level, values in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], values])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        values = np.concatenate(self.levels)
+        if not len(values):
+            return np.full(np.shape(q), np.nan)
+        weights = np.concatenate([np.full(len(v), 2.0 ** level) for level, v in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, cum = values[order], np.cumsum(weights[order])
+        idx = np.searchsorted(cum, np.asarray(q) * cum[-1], side='left')
+        return values[np.minimum(idx, len(values) - 1)]
+
+
+def sketch_columns(chunks, columns=None, k=200, sketches=None):
+    """
+    This function will:
+    - take in an iterable of dataframe chunks (or one dataframe) and optionally the
+      columns to sketch (default: numeric columns of the first chunk)
+    - update one QuantileSketch per column with every chunk
+    - return {column: QuantileSketch}; pass it back in as sketches to keep adding,
+      or merge the dicts of separate partitions with QuantileSketch.merge
+    """
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+    for chunk in chunks:
+        if sketches is None:
+            if columns is None:
+                columns = chunk.select_dtypes('number').columns
+            sketches = {col: QuantileSketch(k) for col in columns}
+        for col, sketch in sketches.items():
+            sketch.update(chunk[col].to_numpy(dtype=np.float64))
+    return sketches
+
+
+def sketch_bounds(sketches, m=1.5):
+    '''IQR bounds (same frame as iqr_bounds) from the sketches of sketch_columns'''
+    q = pd.DataFrame({col: sketch.quantile([.25, .75]) for col, sketch in sketches.items()},
+                     index=[.25, .75])
+    return _bounds(q.loc[.25], q.loc[.75], m)
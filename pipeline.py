@@ -0,0 +1,137 @@
+'''
+Stage-level memoization for the acquire -> prepare pipeline
+
+Classes:
+- Pipeline
+
+Functions:
+- traffic_pipeline
+'''
+
+##### IMPORTS #####
+import os
+import glob
+import hashlib
+
+import pandas as pd
+
+import acquire as acq
+import prepare as prep
+
+# directory for the stage outputs and their default size limit (LRU evicted)
+STAGE_CACHE_DIR = os.path.join(acq.CACHE_DIR, 'stages')
+STAGE_CACHE_BYTES = 10 * 2**30
+
+
+class Pipeline:
+    '''
+    Named stages chained on disk-cached outputs.
+
+    Each stage is a function called as func(**params) when it is the first stage
+    without input data, otherwise func(previous_output, **params). Its output is
+    pickled in cache_dir under a key hashing the previous stage's key (the first
+    stage uses the source file fingerprint), its name, the source of the module
+    it is defined in, the source of its deps and its params. deps lists the
+    functions, classes or modules from elsewhere that the stage calls, so that
+    editing them also invalidates it. Since keys only depend on upstream keys, run() works out every key
+    up front, loads the latest stage that is cached and only computes the stages
+    after it; changing one late stage recomputes that stage and downstream only.
+
+    The cache is kept under max_bytes by evicting the least recently used outputs.
+
+    pipe = Pipeline(source='originial-traff-csv.zip')
+    pipe.add('acquire', acq.get_traffic_data, chunksize=250_000).add('prep_traffic', prep.prep_traffic)
+    df = pipe.run()
+    '''
+
+    def __init__(self, source=None, cache_dir=STAGE_CACHE_DIR, max_bytes=STAGE_CACHE_BYTES):
+        self.source = source
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stages = []
+
+    def add(self, name, func, deps=(), **params):
+        '''Append a stage, returns the pipeline so calls can be chained'''
+        if name in [stage[0] for stage in self.stages]:
+            raise ValueError(f'duplicate stage name: {name}')
+        self.stages.append((name, func, tuple(deps), params))
+        return self
+
+    def _input_key(self, data):
+        '''Fingerprint of what goes into the first stage'''
+        if data is not None:
+            # row hashes in order, plus the column names and dtypes they do not cover
+            columns = data.dtypes.items() if isinstance(data, pd.DataFrame) else [(data.name, data.dtype)]
+            digest = hashlib.sha1(repr([(str(c), str(t)) for c, t in columns]).encode())
+            digest.update(pd.util.hash_pandas_object(data).to_numpy().tobytes())
+            return digest.hexdigest()
+        if self.source is not None:
+            return acq.file_fingerprint(self.source)
+        return ''
+
+    def keys(self, data=None):
+        '''Cache key of every stage, in order'''
+        key, keys = self._input_key(data), []
+        for name, func, deps, params in self.stages:
+            parts = (key, name, acq.code_fingerprint(func, deps), sorted(params.items(), key=lambda p: p[0]))
+            key = hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+            keys.append(key)
+        return keys
+
+    def _path(self, name, key):
+        return os.path.join(self.cache_dir, f'{name}-{key}.pkl')
+
+    def run(self, data=None, until=None):
+        """
+        This function will:
+        - take in optional input data for the first stage and the name of the
+          last stage to run (default: all of them)
+        - load the latest cached stage output and run only the stages after it,
+          caching each new output
+        - return the output of the last stage run
+        """
+        stages = self.stages
+        if until is not None:
+            stages = stages[:[stage[0] for stage in stages].index(until) + 1]
+        keys = self.keys(data)[:len(stages)]
+        start = 0
+        for i in reversed(range(len(stages))):
+            path = self._path(stages[i][0], keys[i])
+            if os.path.isfile(path):
+                data = pd.read_pickle(path)
+                # touch it, the LRU eviction goes by modification time
+                os.utime(path)
+                print(f'{stages[i][0]}: cached')
+                start = i + 1
+                break
+        os.makedirs(self.cache_dir, exist_ok=True)
+        for (name, func, _, params), key in zip(stages[start:], keys[start:]):
+            print(f'{name}: running')
+            data = func(**params) if data is None else func(data, **params)
+            pd.to_pickle(data, self._path(name, key))
+            self._evict(keep=self._path(name, key))
+        return data
+
+    def _evict(self, keep):
+        '''Delete the least recently used outputs until the cache fits in max_bytes'''
+        acq.evict_lru(glob.glob(os.path.join(self.cache_dir, '*.pkl')), self.max_bytes, keep=keep)
+
+    def clear(self):
+        '''Remove every cached stage output'''
+        for f in glob.glob(os.path.join(self.cache_dir, '*.pkl')):
+            os.remove(f)
+
+
+def traffic_pipeline(filename=acq.TRAFFIC_FILE, chunksize=250_000, **kwargs):
+    '''
+    The notebook pipeline as memoized stages:
+    get_traffic_data -> prep_traffic -> prep_output -> remove_class -> remove_outliers -> split_data
+    '''
+    pipe = Pipeline(source=filename, **kwargs)
+    pipe.add('acquire', acq.get_traffic_data, filename=filename, chunksize=chunksize)
+    pipe.add('prep_traffic', prep.prep_traffic)
+    pipe.add('prep_output', prep.prep_output)
+    pipe.add('remove_class', prep.remove_class)
+    pipe.add('remove_outliers', prep.remove_outliers)
+    pipe.add('split_data', prep.split_data)
+    return pipe
@@ -1,61 +1,217 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import MinMaxScaler, StandardScaler, RobustScaler
 
-import matplotlib.pyplot as plt
-import seaborn as sns
+import os
+import json
+import time
+import tracemalloc
 
+# season of each month, indexed by month number (0 is unused)
+SEASONS = np.array(['Unknown', 'Winter', 'Winter', 'Spring', 'Spring', 'Spring', 'Summer',
+                    'Summer', 'Summer', 'Autumn', 'Autumn', 'Autumn', 'Winter'], dtype=object)
 
-def prep_traffic(df):
+
+# columns compact_dtypes stores as categoricals, int8 flags and float32 measurements
+CATEGORY_COLS = ['street', 'city', 'county', 'state', 'zipcode', 'country',
+                 'weather_condition', 'wind_direction', 'season']
+FLAG_COLS = ['amenity', 'bump', 'crossing', 'give_way', 'junction', 'no_exit', 'railway',
+             'roundabout', 'station', 'stop', 'traffic_calming', 'traffic_signal', 'turning_loop']
+INT_COLS = ['severity', 'day_of_week', 'month', 'season']
+FLOAT_COLS = ['distance', 'temp', 'wind_chill', 'humidity', 'pressure', 'visibility',
+              'wind_speed_mph', 'precipitation', 'sunrise_sunset', 'duration']
+
+
+def _float32_lossless(x, max_decimals=6):
+    '''
+    True if float32 keeps every value of x at the precision it has in the source:
+    find the fewest decimals the column is written with, then check that rounding
+    the float32 values back to that many decimals gives the original exactly
+    '''
+    x = x[~np.isnan(x)]
+    x32 = x.astype(np.float32).astype(np.float64)
+    for decimals in range(max_decimals + 1):
+        if np.array_equal(np.round(x, decimals), x):
+            return np.array_equal(np.round(x32, decimals), x)
+    return False
+
+
+def compact_dtypes(df, report=True):
+    """
+    This function will:
+    - convert the text columns in CATEGORY_COLS to categoricals
+    - downcast the 0/1 road flags in FLAG_COLS and the small ints in INT_COLS
+      to int8, if every value fits
+    - downcast the measurements in FLOAT_COLS to float32, if _float32_lossless
+      says no value changes at source precision (otherwise they stay float64)
+    - print a before/after memory report (report=False to silence)
+    - return the compact df
+    """
+    before = df.memory_usage(deep=True).sum()
+    dtypes = {}
+    for col in df.columns:
+        s = df[col]
+        if col in CATEGORY_COLS and s.dtype == object:
+            dtypes[col] = 'category'
+        elif col in FLAG_COLS + INT_COLS and pd.api.types.is_integer_dtype(s.dtype):
+            if len(s) == 0 or (s.min() >= -128 and s.max() <= 127):
+                dtypes[col] = 'int8'
+        elif col in FLOAT_COLS and s.dtype == np.float64:
+            if _float32_lossless(s.to_numpy()):
+                dtypes[col] = 'float32'
+    df = df.astype(dtypes)
+    if report:
+        after = df.memory_usage(deep=True).sum()
+        print(f'memory: {before / 2**20:,.1f} MB -> {after / 2**20:,.1f} MB '
+              f'({after / max(before, 1):.0%} of before)')
+    return df
+
+
+def parse_timestamps(s):
+    '''
+    Parse a column of source timestamps with an explicit format. Most values
+    look like 2016-02-08 05:46:00, the rest carry fractional seconds
+    (2016-02-08 05:46:00.000000000), which are parsed in a second, smaller pass.
+    '''
+    if np.issubdtype(s.dtype, np.datetime64):
+        return s
+    ts = pd.to_datetime(s, format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    frac = ts.isna() & s.notna()
+    if frac.any():
+        # %f takes at most 6 digits, so drop the nanoseconds
+        ts[frac] = pd.to_datetime(s[frac].str.slice(0, 26), format='%Y-%m-%d %H:%M:%S.%f')
+    return ts
+
+
+def add_calendar_features(df, report=True):
+    """
+    This function will:
+    - parse start_time and end_time once each
+    - derive start_date, end_date, start_time_ (time of day, as a timedelta since
+      midnight), day_of_week (0=Monday), month, len_of_affect and season with
+      numpy array operations instead of per-row python objects
+    - print its throughput in rows per second (report=False to silence)
+    - return the df with the new columns
+    """
+    t0 = time.perf_counter()
+    start = parse_timestamps(df['start_time']).to_numpy()
+    end = parse_timestamps(df['end_time']).to_numpy()
+    start_date = start.astype('datetime64[D]')
+    month = start.astype('datetime64[M]').astype('int64') % 12 + 1
+    # 1970-01-01 was a Thursday (weekday 3)
+    day_of_week = (start_date.astype('int64') + 3) % 7
+    nat = np.isnat(start)
+    season = SEASONS[np.where(nat, 0, month)]
+    if nat.any():
+        # missing start times give missing calendar fields, like the .dt accessors
+        month = np.where(nat, np.nan, month)
+        day_of_week = np.where(nat, np.nan, day_of_week)
+    df = df.assign(start_time=start, end_time=end,
+                   start_date=start_date.astype('datetime64[ns]'),
+                   start_time_=start - start_date,
+                   end_date=end.astype('datetime64[D]').astype('datetime64[ns]'),
+                   day_of_week=day_of_week, month=month,
+                   len_of_affect=end - start, season=season)
+    if report:
+        elapsed = time.perf_counter() - t0
+        print(f'calendar features: {len(df):,} rows in {elapsed:.2f}s '
+              f'({len(df) / max(elapsed, 1e-9):,.0f} rows/s)')
+    return df
+
+
+def prep_traffic(df, compact=False, report=True):
+    '''compact=True stores the result with compact_dtypes, report=False silences the stage timings'''
     
     column_mapping = {'Distance(mi)': 'distance', 'Temperature(F)': 'temp', 'Wind_Chill(F)': 'wind_chill', 
                   'Humidity(%)': 'humidity', 'Pressure(in)': 'pressure', 'Visibility(mi)': 'visibility', 
                   'Wind_Speed(mph)': 'wind_speed_mph', 'Precipitation(in)': 'precipitation'
                   }
     states_to_filter = ['CA', 'TX']
+    # rename before filtering, the raw columns are capitalized (State, City, ...)
+    df = df.rename(columns=column_mapping)
+    df.columns = df.columns.str.lower()
     df = df[df['state'].isin(states_to_filter)]
-    df.rename(columns=column_mapping, inplace=True)
     df.dropna(subset=['city'], inplace=True)
     df.dropna(subset=['zipcode'], inplace=True)
-    df.rename(columns=lambda x: x.lower(), inplace=True)
-    df.columns = df.columns.str.lower()
     df.drop(columns=['start_lat', 'start_lng', 'end_lat', 'end_lng', 'timezone', 'airport_code', 'weather_timestamp', 
-                  'source', 'civil_twilight', 'nautical_twilight', 'astronomical_twilight', 'description'], inplace=True)
+                  'source', 'civil_twilight', 'nautical_twilight', 'astronomical_twilight', 'description'],
+            errors='ignore', inplace=True)
     df.replace({True: 1, False: 0}, inplace=True)
-    desired_date = '2021-01-01'
-    df['start_time'] >= desired_date
-    df['start_time'] = pd.to_datetime(df['start_time'], format='%Y-%m-%d')
-    df['end_time'] = pd.to_datetime(df['end_time'], format='%Y-%m-%d')
-    df['start_date'] = df['start_time'].dt.date
-    df['start_date'] = pd.to_datetime(df['start_date'], format='%Y-%m-%d')
-    df['start_time_'] = df['start_time'].dt.time
-    df['end_date'] = df['end_time'].dt.date
-    df['end_date'] = pd.to_datetime(df['end_date'], format='%Y-%m-%d')
-    df['day_of_week'] = df['start_time'].dt.weekday
-    df['month'] = df['start_time'].dt.month
-    df['len_of_affect'] = df.end_time - df.start_time
-    def get_season(month):
-        if month in [12, 1, 2]:
-            return 'Winter'
-        elif month in [3, 4, 5]:
-            return 'Spring'
-        elif month in [6, 7, 8]:
-            return 'Summer'
-        elif month in [9, 10, 11]:
-            return 'Autumn'
-        else:
-            return 'Unknown'
-    df['season'] = df['start_date'].dt.month.apply(get_season)
+    df = add_calendar_features(df, report=report)
     df= df.sort_values(by=['zipcode', 'street'], ascending=[False, True])
-    df.drop(columns=['end_time', 'end_date', 'start_time', 'start_date'], axis=1, inplace=True)
+    # start/end times and dates are kept, prep_output needs them
     df.replace({'Day': 1, 'Night': 0}, inplace=True)    
+    if compact:
+        df = compact_dtypes(df, report=report)
     return df
+
+
+def _zipcode_partitions(zipcode, n):
+    '''
+    Split the rows into n partitions of contiguous zipcode ranges with roughly equal
+    row counts, returned in descending zipcode order (the order prep_traffic sorts in).
+    Rows keep their original order inside a partition; missing zipcodes go in the
+    first partition (prep_traffic drops them).
+    '''
+    codes, uniques = pd.factorize(zipcode, sort=True)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))[::-1]
+    # cut the descending zipcodes where the running row count crosses each 1/n
+    cuts = np.searchsorted(np.cumsum(counts), np.arange(1, n) * counts.sum() / n)
+    group = np.searchsorted(cuts, len(uniques) - 1 - codes, side='right')
+    group[codes < 0] = 0
+    return [np.flatnonzero(group == i) for i in range(n) if (group == i).any()]
+
+
+def prep_traffic_parallel(df, n_jobs=None, verify=False):
+    """
+    This function will:
+    - partition the raw df by state (rows outside prep_traffic's states are dropped
+      up front) and then by zipcode range
+    - run prep_traffic on every partition in a process pool of n_jobs workers
+      (default: all cores)
+    - concatenate the partitions in descending zipcode order, which is the global
+      sort order since prep_traffic's sort is stable, so no final merge sort is needed
+    - with verify=True, also run the serial prep_traffic, check the results are
+      identical and print the speedup
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    n_jobs = n_jobs or os.cpu_count()
+    t0 = time.perf_counter()
+    state = next(col for col in df.columns if col.lower() == 'state')
+    raw = df[df[state].isin(['CA', 'TX'])]
+    zipcode = next(col for col in raw.columns if col.lower() == 'zipcode')
+    parts = [raw.iloc[rows] for rows in _zipcode_partitions(raw[zipcode], n_jobs)]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        results = list(pool.map(partial(prep_traffic, report=False), parts))
+    out = pd.concat(results)
+    elapsed = time.perf_counter() - t0
+    print(f'prep_traffic_parallel: {len(out):,} rows, {len(parts)} partitions '
+          f'on {n_jobs} workers in {elapsed:.2f}s')
+    if verify:
+        t0 = time.perf_counter()
+        serial = prep_traffic(df, report=False)
+        serial_elapsed = time.perf_counter() - t0
+        if not out.equals(serial) or not out.index.equals(serial.index):
+            raise AssertionError('parallel prep_traffic differs from the serial result')
+        print(f'serial: {serial_elapsed:.2f}s   speedup: {serial_elapsed / elapsed:.1f}x')
+    return out
     
 
-def prep_output(df):
+# columns dropped by prep_output (besides the times moved into the index) and remove_class
+OUTPUT_DROP_COLS = ['amenity', 'bump', 'crossing', 'give_way', 'railway', 'roundabout', 'station', 'no_exit', 'stop', 'traffic_calming', 'traffic_signal', 'street', 'junction', 'turning_loop']
+OUTPUT_TIME_COLS = ['start_time', 'end_time', 'start_date', 'start_time_', 'end_date', 'len_of_affect']
+CLASS_COLS = ['weather_condition', 'city', 'state', 'county', 'zipcode', 'country']
+
+# remove_class codes
+SEASON_CODES = {'Winter': 1, 'Spring': 2, 'Summer': 3, 'Autumn': 4}
+WIND_DIRECTION_CODES = {'North': 1, 'NNW': 1, 'N': 1, 'NNE': 1, 'NE': 1, 'NW': 1, 'East': 2, 'E': 2, 'ESE': 2, 'ENE': 2, 'South': 3, 'S': 3, 'SSE': 3, 'SE': 3, 'SW': 3, 'SSW': 3, 'West': 4, 'WNW': 4, 'WSW': 4, 'W': 4}
+WIND_DIRECTION_DROP = ['CALM', 'VAR', 'Variable']
+
+
+def prep_output(df, compact=False):
+    '''compact=True stores the result with compact_dtypes'''
     
-    df.drop(columns=['amenity', 'bump', 'crossing', 'give_way', 'railway', 'roundabout', 'station', 'no_exit', 'stop', 'traffic_calming', 'traffic_signal', 'street', 'junction', 'turning_loop'], inplace=True)    
+    df.drop(columns=OUTPUT_DROP_COLS, inplace=True)    
     df['zipcode'] = df['zipcode'].astype('category')
     df['duration'] = pd.to_timedelta(df['len_of_affect'])
     states_to_filter = ['TX']
@@ -73,41 +229,248 @@ def prep_output(df):
     df = df.drop(columns = 'start_time_')
     df = df.drop(columns = 'end_date')
     df['duration'] = df['duration'].dt.total_seconds() / 3600
-
+    if compact:
+        df = compact_dtypes(df)
 
     return df 
 
-def remove_class(df):
-    df = df.drop(columns = 'weather_condition')
-    df = df.drop(columns = 'city')
-    df = df.drop(columns = 'state')
-    df = df.drop(columns = 'county')
-    df = df.drop(columns = 'zipcode')
-    df = df.drop(columns = 'country')
-    
-    mapping_season = {'Winter': 1, 'Spring': 2, 'Summer': 3, 'Autumn': 4}
-    df['season'] = df['season'].replace(mapping_season)
-    
-    mapping_wind_direction = {'North': 1, 'NNW': 1, 'N': 1, 'NNE': 1, 'NE': 1, 'NW': 1, 'N': 1, 'East': 2, 'E': 2, 'ESE': 2, 'ENE': 2, 'South': 3, 'S': 3, 'SSE': 3, 'SE': 3, 'SW': 3, 'SSW': 3, 'West': 4, 'WNW': 4, 'WSW': 4, 'W': 4}
-    df['wind_direction'] = df['wind_direction'].replace(mapping_wind_direction)
-    
-    values_to_drop = ['CALM', 'VAR', 'Variable']
-    # Drop rows containing the specified values
-    df = df[~df['wind_direction'].isin(values_to_drop)]
-    df['wind_direction'] = df['wind_direction'].astype(int)
+class ClassEncoder:
+    '''
+    Fitted code tables for remove_class.
 
+    fit learns the categories of each encoded column once; transform then encodes
+    through categorical codes and a lookup array (one hash pass and one array index
+    per column, no per-value dict replace) and drops the rows whose value is in drop.
+    save / load write the tables as json, so training and scoring share the exact
+    same mapping.
+
+    - mappings: {column: {value: code}}, default season and wind_direction codes
+    - drop: {column: [values whose rows are dropped]}, default CALM/VAR wind
+    - missing: {column: [values encoded as missing]}, default the 'Unknown' season
+      add_calendar_features gives rows without a start_time; NaN is always missing,
+      and a column with missing values comes out as float with NaN, like the old
+      remove_class left them uncoded
+    '''
+
+    # lookup entries for values that drop their row / were never seen in fit / are missing
+    DROP = -1
+    UNKNOWN = -2
+    MISSING = -3
+
+    def __init__(self, mappings=None, drop=None, missing=None):
+        self.mappings = mappings or {'season': SEASON_CODES, 'wind_direction': WIND_DIRECTION_CODES}
+        self.drop = drop if drop is not None else {'wind_direction': WIND_DIRECTION_DROP}
+        self.missing = missing if missing is not None else {'season': [SEASONS[0]]}
+        self.categories_ = None
+
+    def fit(self, df):
+        '''Learn the categories of every mapped column (observed values plus the known ones)'''
+        self.categories_ = {}
+        for col, mapping in self.mappings.items():
+            known = set(mapping) | set(self.drop.get(col, [])) | set(self.missing.get(col, []))
+            observed = pd.unique(df[col].dropna().astype(object)) if col in df.columns else []
+            self.categories_[col] = sorted(known | set(observed))
+        return self
+
+    def _lookup(self, col):
+        '''Code for each fitted category of col, followed by the code for NaN'''
+        mapping, drop = self.mappings[col], set(self.drop.get(col, []))
+        missing = set(self.missing.get(col, []))
+        lookup = [self.DROP if cat in drop else self.MISSING if cat in missing
+                  else mapping.get(cat, self.UNKNOWN) for cat in self.categories_[col]]
+        return np.array(lookup + [self.MISSING], dtype=np.int64)
+
+    def encode(self, df):
+        '''
+        Codes of the mapped columns of df as {column: array} and the mask of rows to
+        keep, without building a new frame
+        '''
+        if self.categories_ is None:
+            raise ValueError('ClassEncoder is not fitted, call fit first')
+        encoded, keep = {}, np.ones(len(df), dtype=bool)
+        for col in self.mappings:
+            codes = pd.Categorical(df[col], categories=self.categories_[col]).codes
+            # NaN and values outside the fitted categories have code -1, the last
+            # lookup entry; tell them apart by whether the value itself is NaN
+            values = self._lookup(col)[codes]
+            bad = (values == self.MISSING) & (codes == -1) & df[col].notna().to_numpy()
+            values[bad] = self.UNKNOWN
+            bad = values == self.UNKNOWN
+            if bad.any():
+                raise ValueError(f'{col} has values without a code: {pd.unique(df[col][bad])[:10]}')
+            keep &= values != self.DROP
+            missing = values == self.MISSING
+            if missing.any():
+                values = np.where(missing, np.nan, values)
+            encoded[col] = values
+        return encoded, keep
+
+    def transform(self, df):
+        '''Encode the mapped columns of df and drop the rows marked for dropping'''
+        encoded, keep = self.encode(df)
+        df = df.assign(**encoded)
+        return df if keep.all() else df[keep]
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def save(self, path):
+        '''Write the fitted code tables to path as json'''
+        with open(path, 'w') as f:
+            json.dump({'mappings': self.mappings, 'drop': self.drop, 'missing': self.missing,
+                       'categories': self.categories_}, f)
+
+    @classmethod
+    def load(cls, path):
+        '''Read an encoder written by save'''
+        with open(path) as f:
+            tables = json.load(f)
+        encoder = cls(tables['mappings'], tables['drop'], tables.get('missing'))
+        encoder.categories_ = tables['categories']
+        return encoder
+
+
+def remove_class(df, encoder=None):
+    '''
+    Drop the classification columns and encode season / wind_direction (dropping
+    CALM / VAR winds) with encoder, a fitted ClassEncoder (fitted on df if None)
+    '''
+    df = df.drop(columns=CLASS_COLS)
+    if encoder is None:
+        encoder = ClassEncoder().fit(df)
+    return encoder.transform(df)
     
-    return df
-    
-def remove_outliers(df):
+def _mb(nbytes):
+    return nbytes / 2**20
+
+
+def _check_budget(stage, peak, memory_budget, report):
+    '''Print the peak bytes of a stage and raise MemoryError if it is over memory_budget (MB)'''
+    if report:
+        print(f'{stage}: peak {_mb(peak):,.1f} MB')
+    if memory_budget is not None and _mb(peak) > memory_budget:
+        raise MemoryError(f'prep_lean stage "{stage}" needs {_mb(peak):,.1f} MB at peak, '
+                          f'over the memory budget of {memory_budget:,.1f} MB')
+
+
+def prep_lean(df, remove_classes=True, memory_budget=None, report=True, encoder=None):
+    """
+    This function will:
+    - give the same rows and values as prep_output (followed by remove_class if
+      remove_classes), without the chain of drops and filtered copies
+    - build the row mask and the list of kept columns first, then copy only the kept
+      cells of each column, once, and encode season / wind_direction in place on the
+      output; the input df is not modified
+    - take an optional memory_budget (MB) for the peak of input + everything the
+      stages allocate: check each stage's estimate before running it (fail fast with
+      a MemoryError), then its measured peak (tracemalloc) after it
+    - print the estimated and measured peak of each stage (report=False to silence;
+      without report or a budget nothing is traced)
+    - zipcode categories only cover the kept rows
+    - encoder: fitted ClassEncoder for remove_classes (fitted on the kept rows if None)
+    """
+    col_bytes = {col: df[col].memory_usage(deep=True, index=False) for col in df.columns}
+    base = sum(col_bytes.values()) + df.index.memory_usage(deep=True)
+    # the input already exists, tracing from here on counts what prep_lean adds to it
+    trace = report or memory_budget is not None
+    started = trace and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    def measured(stage):
+        if trace:
+            _check_budget(f'{stage} (measured)', base + tracemalloc.get_traced_memory()[1],
+                          memory_budget, report)
+            tracemalloc.reset_peak()
+
+    try:
+        if trace:
+            tracemalloc.reset_peak()
+        # stage 1: row mask
+        _check_budget('mask (estimate)', base + len(df), memory_budget, report)
+        mask = df['state'].isin(['TX']).to_numpy()
+        for col in ['weather_condition', 'sunrise_sunset', 'wind_direction']:
+            mask &= df[col].notna().to_numpy()
+        if remove_classes:
+            mask &= ~df['wind_direction'].isin(WIND_DIRECTION_DROP).to_numpy()
+        rows = np.flatnonzero(mask)
+        measured('mask')
+        # stage 2: one gather per kept column
+        drop = OUTPUT_DROP_COLS + OUTPUT_TIME_COLS + (CLASS_COLS if remove_classes else [])
+        keep = [col for col in df.columns if col not in drop]
+        frac = len(rows) / max(len(df), 1)
+        gather = sum(col_bytes[col] for col in keep) * frac + len(rows) * 16
+        # parse_timestamps / to_timedelta hold one full length temporary each
+        est = gather + len(df) * 16 + len(df) + rows.nbytes
+        _check_budget('select (estimate)', base + est, memory_budget, report)
+        data = {col: df[col].array.take(rows) for col in keep}
+        index = pd.DatetimeIndex(parse_timestamps(df['start_time']).array.take(rows), name='start_time')
+        data['duration'] = pd.to_timedelta(df['len_of_affect'].array.take(rows)).total_seconds() / 3600
+        out = pd.DataFrame(data, index=index, copy=False)
+        del data
+        measured('select')
+        # stage 3: codes, written over the gathered columns
+        _check_budget('encode (estimate)', base + len(df) + rows.nbytes + gather + len(rows) * 16,
+                      memory_budget, report)
+        if remove_classes:
+            encoded, keep_rows = (encoder or ClassEncoder().fit(out)).encode(out)
+            for col, values in encoded.items():
+                out[col] = values
+            # the mask already dropped CALM / VAR winds, unless encoder drops more
+            if not keep_rows.all():
+                out = out[keep_rows]
+        else:
+            out['zipcode'] = out['zipcode'].astype('category')
+        measured('encode')
+    finally:
+        if started:
+            tracemalloc.stop()
+    return out
+
+
+# continuous columns remove_outliers filters on
+OUTLIER_COLS = ['distance', 'temp', 'wind_chill', 'humidity', 'pressure', 'visibility', 'wind_speed_mph', 'precipitation', 'duration']
+
+
+def outlier_stats(df, columns=OUTLIER_COLS):
+    '''
+    Running statistics of the outlier columns as a dataframe indexed by column:
+    count (non-null), mean and m2 (sum of squared deviations from the mean).
+    Stats of separate batches combine with merge_stats.
+    '''
+    x = df[columns]
+    count = x.count()
+    stats = pd.DataFrame({'count': count, 'mean': x.mean(), 'm2': x.var(ddof=0) * count})
+    return stats.fillna(0.0)
+
+
+def merge_stats(a, b):
+    '''Combine two outlier_stats frames (Chan et al. parallel mean/variance update)'''
+    n = a['count'] + b['count']
+    safe_n = n.where(n > 0, 1)
+    delta = b['mean'] - a['mean']
+    mean = a['mean'] + delta * b['count'] / safe_n
+    m2 = a['m2'] + b['m2'] + delta ** 2 * a['count'] * b['count'] / safe_n
+    return pd.DataFrame({'count': n, 'mean': mean, 'm2': m2})
+
+
+def remove_outliers(df, stats=None):
+    '''
+    stats: optional outlier_stats (e.g. the running statistics of the full history)
+    to take the means and standard deviations from, instead of rescanning df
+    '''
     
         #got rid of outliers across all continuous variable features of impact outside of 3 standard deviations
-    columns_to_filter = ['distance', 'temp', 'wind_chill', 'humidity', 'pressure', 'visibility', 'wind_speed_mph', 'precipitation', 'duration']
+    columns_to_filter = OUTLIER_COLS
     
     threshold = 3
     
     # Calculate z-scores for the specified columns
-    z_scores = df[columns_to_filter].apply(lambda x: np.abs((x - x.mean()) / x.std()))
+    if stats is None:
+        z_scores = df[columns_to_filter].apply(lambda x: np.abs((x - x.mean()) / x.std()))
+    else:
+        std = np.sqrt(stats['m2'] / (stats['count'] - 1))
+        z_scores = ((df[columns_to_filter] - stats['mean']) / std).abs()
     
     # Filter the DataFrame to exclude rows with outliers in any of the columns
     df = df[(z_scores <= threshold).all(axis=1)]
@@ -125,8 +488,97 @@ def remove_outliers(df):
     return df
     
     
-def split_data(df):
-    '''Split into train, validate, test with a 60/20/20 ratio'''
-    train_validate, test = train_test_split(df, test_size=.2, random_state=42)
-    train, validate = train_test_split(train_validate, test_size=.25, random_state=42)
-    return train, validate, test
\ No newline at end of file
+def _iter_chunks(chunks):
+    '''A fresh iterator over chunks, which is either a list of frames or a function returning an iterable of them'''
+    return iter(chunks()) if callable(chunks) else iter(chunks)
+
+
+def outlier_stats_chunked(chunks, columns=OUTLIER_COLS):
+    '''
+    One pass over chunks (see _iter_chunks) merging each chunk's outlier_stats,
+    so the full dataset never has to fit in memory
+    '''
+    stats = None
+    for chunk in _iter_chunks(chunks):
+        chunk_stats = outlier_stats(chunk, columns)
+        stats = chunk_stats if stats is None else merge_stats(stats, chunk_stats)
+    return stats
+
+
+def remove_outliers_chunked(chunks, stats=None):
+    """
+    This function will:
+    - take in chunks, either a list of prepared frames or a function returning a
+      fresh iterable of them (e.g. lambda: pd.read_csv(path, chunksize=...)), since
+      the data is read twice
+    - first pass (skipped if stored stats are passed): outlier_stats_chunked
+    - second pass: yield each chunk filtered by remove_outliers with those stats
+    - gives the same rows as remove_outliers on the concatenated chunks
+    """
+    if stats is None:
+        stats = outlier_stats_chunked(chunks)
+    for chunk in _iter_chunks(chunks):
+        yield remove_outliers(chunk, stats=stats)
+
+
+def hash_split(values, sizes=(.6, .2, .2)):
+    '''
+    Split label (0 train, 1 validate, 2 test) for each value, from a deterministic
+    hash of the value itself, so a record lands in the same split whichever chunk,
+    load or run it arrives in
+    '''
+    hashes = pd.util.hash_pandas_object(pd.Series(np.asarray(values, dtype=object)), index=False)
+    buckets = (hashes.to_numpy() % 10_000) / 10_000
+    return np.searchsorted(np.cumsum(sizes)[:-1], buckets, side='right')
+
+
+def split_indices(df, mode='random', key='id', sizes=(.6, .2, .2), random_state=42):
+    """
+    This function will:
+    - take in a dataframe (or acquire.TrafficDataset) and a split mode
+        - random: the same shuffles split_data has always used
+        - time: chronological on the start_time index, oldest rows in train
+        - hash: hash_split on the key column, stable across loads
+    - return train, validate and test integer row positions, which can be saved
+      with save_split and applied with df.iloc / df.take when the rows are needed
+    """
+    n = len(df)
+    if mode == 'random':
+        from sklearn.model_selection import train_test_split
+        # splitting positions gives the same shuffles as splitting the frame
+        test_size = sizes[2]
+        val_size = sizes[1] / (sizes[0] + sizes[1])
+        train_validate, test = train_test_split(np.arange(n), test_size=test_size, random_state=random_state)
+        train, validate = train_test_split(train_validate, test_size=val_size, random_state=random_state)
+        return train, validate, test
+    if mode == 'time':
+        order = np.argsort(np.asarray(df.index), kind='stable')
+        cuts = np.round(np.cumsum(sizes)[:-1] * n).astype(int)
+        return tuple(np.split(order, cuts))
+    if mode == 'hash':
+        labels = hash_split(df[key], sizes)
+        return tuple(np.flatnonzero(labels == i) for i in range(3))
+    raise ValueError(f'unknown split mode: {mode}')
+
+
+def save_split(path, indices):
+    '''Save split_indices output as a .npz file'''
+    train, validate, test = indices
+    np.savez(path, train=train, validate=validate, test=test)
+
+
+def load_split(path):
+    '''Load split indices saved with save_split'''
+    with np.load(path) as split:
+        return split['train'], split['validate'], split['test']
+
+
+def split_data(df, mode='random', indices=None):
+    '''Split into train, validate, test with a 60/20/20 ratio
+    mode is passed to split_indices; indices (e.g. from load_split) reuses a stored split
+    A memory-mapped acquire.TrafficDataset is split into row handles, so no columns are copied'''
+    if indices is None:
+        indices = split_indices(df, mode)
+    if not isinstance(df, pd.DataFrame):
+        return tuple(df.take(idx) for idx in indices)
+    return tuple(df.iloc[idx] for idx in indices)
@@ -0,0 +1,266 @@
+'''
+Least squares over feature subsets from precomputed Gram matrices
+
+Classes:
+- GramSubsets
+'''
+
+##### IMPORTS #####
+import heapq
+import itertools
+import math
+
+import numpy as np
+
+# subsets solved per stacked np.linalg.solve call
+SUBSET_BATCH = 4096
+# condition number of XᵀX above which a subset counts as collinear
+SINGULAR_COND = 1e12
+
+
+def _as_1d(y):
+    '''Target (Series or one column DataFrame) as a float64 vector'''
+    return np.asarray(y, dtype=np.float64).reshape(-1)
+
+
+class GramSubsets:
+    '''
+    Train / validate metrics of LinearRegression on any subset of the features,
+    without touching the rows again.
+
+    The rows are read once to build, centered on the train means:
+    - train: G = XᵀX, b = Xᵀy, syy = yᵀy
+    - validate: Gv = XvᵀXv, bv = Xvᵀyv, svv = yvᵀyv
+    A subset S then solves G[S, S] beta = b[S] (the intercept is the train mean),
+    and its residual sums of squares are
+    - train: syy - b[S]ᵀ beta
+    - validate: svv - 2 bv[S]ᵀ beta + betaᵀ Gv[S, S] beta
+    which give the same rmse and R² as fitting LinearRegression on Xtr[S].
+
+    gram = GramSubsets(Xtr, ytr, Xv, yv)
+    gram.metrics(['temp_s', 'pressure_s'])
+    rows = list(gram.rows(2))
+    '''
+
+    def __init__(self, Xtr, ytr, Xv, yv, features=None):
+        if features is None:
+            features = Xtr.columns.to_list()
+        self.features = list(features)
+        X = Xtr[self.features].to_numpy(dtype=np.float64)
+        y = _as_1d(ytr)
+        self.x_mean, self.y_mean = X.mean(axis=0), y.mean()
+        X = X - self.x_mean
+        y = y - self.y_mean
+        self.n, self.G, self.b, self.syy = len(y), X.T @ X, X.T @ y, y @ y
+        # validation rows centered on the *train* means, the fitted intercept
+        Z = Xv[self.features].to_numpy(dtype=np.float64) - self.x_mean
+        yv = _as_1d(yv)
+        w = yv - self.y_mean
+        self.nv, self.Gv, self.bv, self.svv = len(w), Z.T @ Z, Z.T @ w, w @ w
+        # validation total sum of squares around its own mean, for R²
+        self.sst_v = ((yv - yv.mean()) ** 2).sum()
+        self._index = {f: i for i, f in enumerate(self.features)}
+
+    def columns(self, features):
+        '''Positions of features in the Gram matrices'''
+        return [self._index[f] for f in features]
+
+    def _solve(self, idx):
+        '''Coefficients of the stacked subsets idx (k x r positions)'''
+        G = self.G[idx[:, :, None], idx[:, None, :]]
+        b = self.b[idx]
+        # collinear subsets get the minimum norm solution, like LinearRegression
+        singular = np.linalg.cond(G) > SINGULAR_COND
+        beta = np.empty(b.shape)
+        if not singular.all():
+            beta[~singular] = np.linalg.solve(G[~singular], b[~singular][..., None])[..., 0]
+        for k in np.flatnonzero(singular):
+            beta[k] = np.linalg.lstsq(G[k], b[k], rcond=None)[0]
+        return beta
+
+    def _metrics(self, idx, beta=None):
+        '''
+        rmse_tr, rmse_v, r2_tr, r2_v arrays (unrounded) for the stacked subsets idx,
+        with their least squares coefficients unless beta is given
+        '''
+        if beta is None:
+            beta = self._solve(idx)
+            rss = self.syy - np.einsum('kr,kr->k', self.b[idx], beta)
+        else:
+            G = self.G[idx[:, :, None], idx[:, None, :]]
+            rss = (self.syy - 2 * np.einsum('kr,kr->k', self.b[idx], beta)
+                   + np.einsum('kr,krs,ks->k', beta, G, beta))
+        Gv = self.Gv[idx[:, :, None], idx[:, None, :]]
+        rss_v = (self.svv - 2 * np.einsum('kr,kr->k', self.bv[idx], beta)
+                 + np.einsum('kr,krs,ks->k', beta, Gv, beta))
+        rss, rss_v = np.clip(rss, 0, None), np.clip(rss_v, 0, None)
+        return (np.sqrt(rss / self.n), np.sqrt(rss_v / self.nv),
+                1 - rss / self.syy, 1 - rss_v / self.sst_v)
+
+    def fit(self, features):
+        '''intercept and coefficients of LinearRegression on features'''
+        idx = np.array([self.columns(features)])
+        beta = self._solve(idx)[0]
+        return self.y_mean - self.x_mean[idx[0]] @ beta, beta
+
+    def lasso_path(self, features, alpha_min):
+        '''
+        LARS lasso path of features down to alpha_min, from the Gram submatrix:
+        the path's alphas (decreasing) and coefficients (features x alphas)
+        '''
+        from sklearn.linear_model import lars_path_gram
+        idx = np.array(self.columns(features))
+        alphas, _, coefs = lars_path_gram(Xy=self.b[idx], Gram=self.G[np.ix_(idx, idx)],
+                                          n_samples=self.n, alpha_min=alpha_min, method='lasso',
+                                          max_iter=500, eps=np.finfo(float).eps)
+        return alphas, coefs
+
+    def lasso_rows(self, r, alpha, features=None):
+        """
+        This function will:
+        - take in a subset size r, the alphas and optionally the features to combine
+        - compute the lasso path of every itertools.combinations(features, r) subset
+          once, down to the smallest alpha
+        - read the coefficients at each alpha off the path (it is piecewise linear
+          in alpha), which is what LassoLars(alpha=a, normalize=False) fits
+        - yield reg_mods rows (model LassoLars) in itertools.product(combos, alpha)
+          order, rounded like metrics_reg
+        """
+        alpha = list(alpha)
+        if not alpha:
+            return
+        features = self.features if features is None else list(features)
+        for combo in itertools.combinations(features, r):
+            path_alphas, coefs = self.lasso_path(combo, min(alpha))
+            # np.interp wants increasing x: past the largest alpha everything is 0,
+            # below the path's end the coefficients stay at the last step
+            beta = np.array([[np.interp(a, path_alphas[::-1], c[::-1]) for c in coefs] for a in alpha])
+            idx = np.tile(self.columns(combo), (len(alpha), 1))
+            rmse_tr, rmse_v, r2_tr, r2_v = self._metrics(idx, beta)
+            for k, a in enumerate(alpha):
+                yield {
+                    'model': 'LassoLars',
+                    'features': list(combo),
+                    'params': f'alpha={a}',
+                    'rmse_tr': round(rmse_tr[k], 2),
+                    'rmse_v': round(rmse_v[k], 2),
+                    'r2_tr': round(r2_tr[k], 4),
+                    'r2_v': round(r2_v[k], 4)
+                }
+
+    def rss(self, idx):
+        '''Train residual sum of squares of the stacked subsets idx (k x r positions)'''
+        return self.syy - np.einsum('kr,kr->k', self.b[idx], self._solve(idx))
+
+    def metrics(self, features):
+        '''rmse_tr, rmse_v, r2_tr, r2_v of LinearRegression on features, rounded like metrics_reg'''
+        rmse_tr, rmse_v, r2_tr, r2_v = (m[0] for m in self._metrics(np.array([self.columns(features)])))
+        return round(rmse_tr, 2), round(rmse_v, 2), round(r2_tr, 4), round(r2_v, 4)
+
+    def rows(self, r, features=None):
+        """
+        This function will:
+        - take in a subset size r and optionally the features to combine
+          (default: all of them)
+        - solve every itertools.combinations(features, r) subset, SUBSET_BATCH at a time
+        - yield reg_mods rows (model LinearRegression) in combinations order,
+          rounded like metrics_reg
+        """
+        features = self.features if features is None else list(features)
+        combos = itertools.combinations(self.columns(features), r)
+        while True:
+            batch = list(itertools.islice(combos, SUBSET_BATCH))
+            if not batch:
+                return
+            idx = np.array(batch)
+            rmse_tr, rmse_v, r2_tr, r2_v = self._metrics(idx)
+            for k, cols in enumerate(batch):
+                yield {
+                    'model': 'LinearRegression',
+                    'features': [self.features[c] for c in cols],
+                    'params': 'None',
+                    'rmse_tr': round(rmse_tr[k], 2),
+                    'rmse_v': round(rmse_v[k], 2),
+                    'r2_tr': round(r2_tr[k], 4),
+                    'r2_v': round(r2_v[k], 4)
+                }
+
+    def best(self, top=5, max_size=None, features=None):
+        """
+        This function will:
+        - take in how many subsets to keep per size, the largest size (default: all
+          features) and optionally the features to search (default: all of them)
+        - find the top subsets of every size by train RSS with a leaps-and-bounds
+          style branch and bound: adding features never raises the RSS, so a branch
+          that can only add features from C to the included set I cannot beat
+          RSS(I ∪ C), and is skipped when that is no better than the current top
+          for every size the branch can reach
+        - features are tried in order of how much the full model's RSS grows
+          without them, which makes the bounds bite early
+        - yield reg_mods rows (model LinearRegression) by size, best first
+        """
+        cols = self.columns(self.features if features is None else features)
+        max_size = len(cols) if max_size is None else min(max_size, len(cols))
+
+        solves = 0
+
+        def rss(subset):
+            nonlocal solves
+            solves += 1
+            return self.rss(np.array([subset]))[0]
+
+        full = rss(cols)
+        loss = [rss([c for c in cols if c != col]) - full if len(cols) > 1 else 0 for col in cols]
+        order = tuple(col for _, col in sorted(zip(loss, cols), key=lambda x: -x[0]))
+
+        # per size a max-heap (by -rss) of the best `top` subsets so far
+        heaps = {size: [] for size in range(1, max_size + 1)}
+
+        def beaten(bound, lo, hi):
+            '''True when no size in lo..hi can use a subset with RSS >= bound'''
+            for size in range(lo, min(hi, max_size) + 1):
+                if len(heaps[size]) < top or bound < -heaps[size][0][0]:
+                    return False
+            return True
+
+        stack = [((), order, -np.inf)]
+        while stack:
+            included, rest, bound = stack.pop()
+            if included:
+                if beaten(bound, len(included), len(included) + len(rest)):
+                    continue
+                # with nothing left to add the bound is the subset's own RSS
+                value = bound if not rest else rss(included)
+                heap = heaps[len(included)]
+                item = (-value, tuple(sorted(included)))
+                if len(heap) < top:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            if len(included) == max_size:
+                continue
+            # children in reverse so the first (largest union) is explored first
+            for j in reversed(range(len(rest))):
+                child = included + (rest[j],)
+                bound = rss(child + rest[j + 1:])
+                if not beaten(bound, len(child), len(child) + len(rest) - j - 1):
+                    stack.append((child, rest[j + 1:], bound))
+        total = sum(math.comb(len(cols), size) for size in range(1, max_size + 1))
+        print(f'best subsets: {solves:,} least squares solves for {total:,} subsets')
+
+        for size in range(1, max_size + 1):
+            subsets = [np.array(cols) for _, cols in sorted(heaps[size], reverse=True)]
+            if not subsets:
+                continue
+            idx = np.stack(subsets)
+            rmse_tr, rmse_v, r2_tr, r2_v = self._metrics(idx)
+            for k, subset in enumerate(idx):
+                yield {
+                    'model': 'LinearRegression',
+                    'features': [self.features[c] for c in subset],
+                    'params': 'None',
+                    'rmse_tr': round(rmse_tr[k], 2),
+                    'rmse_v': round(rmse_v[k], 2),
+                    'r2_tr': round(r2_tr[k], 4),
+                    'r2_v': round(r2_v[k], 4)
+                }
@@ -0,0 +1,105 @@
+'''
+Process pool model sweeps over train / validate frames in shared memory
+
+Functions:
+- share_frames
+- run_sweep
+'''
+
+##### IMPORTS #####
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# seconds between progress lines
+PROGRESS_EVERY = 5
+
+# what a worker fits on: the frames rebuilt on shared memory by _attach
+_SHARED = {}
+_BLOCKS = []
+
+
+def share_frames(frames):
+    """
+    This function will:
+    - take in a dict of name -> numeric dataframe
+    - copy each one's values (float32 frames stay float32, anything else becomes
+      float64) into a new shared memory block
+    - return the specs a worker needs to attach (name, block name, shape, dtype,
+      columns)
+      and the blocks, which the caller closes and unlinks when the sweep is done
+    """
+    from multiprocessing import shared_memory
+    specs, blocks = [], []
+    for name, df in frames.items():
+        values = df.to_numpy()
+        if values.dtype != np.float32:
+            values = values.astype(np.float64)
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+        specs.append((name, block.name, values.shape, values.dtype.str, list(df.columns)))
+        blocks.append(block)
+    return specs, blocks
+
+
+def _attach(specs):
+    '''Pool initializer: rebuild the frames on the shared blocks, without copying'''
+    from multiprocessing import shared_memory
+    for name, block_name, shape, dtype, columns in specs:
+        # pool workers share the parent's resource tracker, which unlinks the block
+        # only if the parent never does
+        block = shared_memory.SharedMemory(name=block_name)
+        _BLOCKS.append(block)
+        values = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        _SHARED[name] = pd.DataFrame(values, columns=columns, copy=False)
+
+
+def _call(job):
+    func, task = job
+    return func(task, **_SHARED)
+
+
+def run_sweep(func, tasks, frames, n_jobs=None, chunksize=1, report=True):
+    """
+    This function will:
+    - take in a top level function func(task, **frames) returning one result row,
+      the list of tasks, the dict of name -> dataframe it fits on and the worker count
+      (default: all cores, 1 runs in this process without a pool)
+    - put the frames in shared memory once, so workers attach to them instead of
+      receiving a pickled copy per task
+    - run the tasks over a process pool, printing progress and fits per second
+      every PROGRESS_EVERY seconds (report=False to silence)
+    - return the results in task order, whatever the worker count
+    """
+    n_jobs = n_jobs or os.cpu_count()
+    total, results = len(tasks), []
+    t0 = last = time.perf_counter()
+
+    def progress(done, force=False):
+        nonlocal last
+        now = time.perf_counter()
+        if report and (force or now - last >= PROGRESS_EVERY):
+            last = now
+            print(f'sweep: {done:,}/{total:,} fits in {now - t0:.1f}s '
+                  f'({done / max(now - t0, 1e-9):,.1f} fits/s, {n_jobs} workers)')
+
+    if n_jobs == 1:
+        for task in tasks:
+            results.append(func(task, **frames))
+            progress(len(results))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        specs, blocks = share_frames(frames)
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_attach, initargs=(specs,)) as pool:
+                for row in pool.map(_call, [(func, task) for task in tasks], chunksize=chunksize):
+                    results.append(row)
+                    progress(len(results))
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+    progress(total, force=True)
+    return results